@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from counters import dashboard_counters, ACTIVITY_LOGS
+from rollups import activity_rollups
+from sharing import sharing_detector
+
+logger = logging.getLogger(__name__)
+
+# "async" batches writes in the background, "sync" inserts inline (tests, scripts)
+ACTIVITY_LOG_MODE = os.environ.get("ACTIVITY_LOG_MODE", "async").lower()
+ACTIVITY_LOG_QUEUE_SIZE = int(os.environ.get("ACTIVITY_LOG_QUEUE_SIZE", "10000"))
+ACTIVITY_LOG_BATCH_SIZE = int(os.environ.get("ACTIVITY_LOG_BATCH_SIZE", "200"))
+ACTIVITY_LOG_FLUSH_INTERVAL = float(os.environ.get("ACTIVITY_LOG_FLUSH_INTERVAL", "1.0"))
+# How long a request may wait for queue space before its log entry is dropped
+ACTIVITY_LOG_ENQUEUE_TIMEOUT = float(os.environ.get("ACTIVITY_LOG_ENQUEUE_TIMEOUT", "0.05"))
+
+class ActivityLogSink:
+    """Bounded queue of activity log documents flushed with insert_many"""
+
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float, enqueue_timeout: float):
+        self.queue_size = queue_size
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.backpressure_waits = 0
+        self.failed = 0
+        self.flushes = 0
+        self.sync_writes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db: AsyncIOMotorDatabase):
+        """Start the background flusher unless running in sync mode"""
+        self._db = db
+        if ACTIVITY_LOG_MODE == "sync" or self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+        logger.info("Activity log sink started")
+
+    async def stop(self):
+        """Flush everything still queued and stop the flusher"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info("Activity log sink stopped")
+
+    async def write(self, db: AsyncIOMotorDatabase, activity: Dict[str, Any]):
+        """Queue an activity document, or insert it inline when not running"""
+        if not self.running:
+            await db.activity_logs.insert_one(activity)
+            self.sync_writes += 1
+            await dashboard_counters.increment(db, ACTIVITY_LOGS)
+            await activity_rollups.record(db, [activity])
+            sharing_detector.observe(activity)
+            return
+
+        try:
+            self._queue.put_nowait(activity)
+        except asyncio.QueueFull:
+            self.backpressure_waits += 1
+            try:
+                await asyncio.wait_for(self._queue.put(activity), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.warning("Activity log queue full, dropped %s entry", activity.get("activity_type"))
+                return
+        self.enqueued += 1
+
+    async def _run(self):
+        """Drain the queue, flushing on batch size or flush interval"""
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+        # Drain anything enqueued after the stop sentinel
+        remaining = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                remaining.append(item)
+        for start in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[start:start + self.batch_size])
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        """Write one batch, counting partial failures"""
+        self.flushes += 1
+        written = batch
+        try:
+            await self._db.activity_logs.insert_many(batch, ordered=False)
+        except Exception as e:
+            # With ordered=False the server still inserts every valid document
+            details = getattr(e, "details", None) or {}
+            rejected = {error["index"] for error in details.get("writeErrors", [])}
+            written = [a for i, a in enumerate(batch) if i not in rejected] if details else []
+            self.failed += len(batch) - len(written)
+            logger.error(f"Failed to write activity log batch: {str(e)}")
+        inserted = len(written)
+        self.written += inserted
+        await activity_rollups.record(self._db, written)
+        for activity in written:
+            sharing_detector.observe(activity)
+
+        try:
+            await dashboard_counters.increment(self._db, ACTIVITY_LOGS, inserted)
+        except Exception as e:
+            logger.error(f"Failed to update activity log counter: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue and throughput counters for monitoring"""
+        return {
+            "mode": "async" if self.running else "sync",
+            "queue_depth": self._queue.qsize() if self.running else 0,
+            "queue_size": self.queue_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "sync_writes": self.sync_writes,
+            "flushes": self.flushes,
+            "backpressure_waits": self.backpressure_waits,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+# Shared sink used by utils.log_activity
+activity_sink = ActivityLogSink(
+    ACTIVITY_LOG_QUEUE_SIZE, ACTIVITY_LOG_BATCH_SIZE,
+    ACTIVITY_LOG_FLUSH_INTERVAL, ACTIVITY_LOG_ENQUEUE_TIMEOUT
+)
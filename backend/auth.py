@@ -1,5 +1,9 @@
 from datetime import datetime, timedelta
 from typing import Optional, Union
+import asyncio
+import logging
+import secrets
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, Request
@@ -9,22 +13,104 @@ from models import User, TokenData, ActivityType
 import os
 from database import get_database
 from utils import log_activity
+from hash_executor import password_executor, ExecutorSaturated
+from cache import TTLCache
+from login_throttle import get_login_throttle, failed_login_log, UNKNOWN_ACCOUNT
 
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# bcrypt cost factor (2^rounds iterations); see benchmarks/bcrypt_cost.py.
+# Hashes at any other cost are re-hashed the next time their owner logs in.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Reverse proxies in front of the app that append to X-Forwarded-For. Login
+# throttling keys on the address the outermost of them saw; with 0 it uses
+# the TCP peer, since any other X-Forwarded-For entry is set by the client.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 security = HTTPBearer()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+# Authenticated principals keyed by raw token. Entries are evicted explicitly
+# when an admin deletes or deactivates a user or company; the TTL bounds how
+# long another worker process may keep serving a stale entry.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+async def _run_hash_job(func, *args):
+    """Run a bcrypt operation on the hashing pool, mapping saturation to 503"""
+    try:
+        return await password_executor.run(func, *args)
+    except ExecutorSaturated as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service busy, please retry",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against a hashed password"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return await _run_hash_job(pwd_context.verify, plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
+async def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return await _run_hash_job(pwd_context.hash, password)
+
+# Background re-hash tasks, referenced until done so they are not collected
+_rehash_tasks: set = set()
+rehash_stats = {"scheduled": 0, "rehashed": 0, "skipped": 0, "failed": 0}
+
+async def _rehash_password(db: AsyncIOMotorDatabase, user_id: str, old_hash: str, password: str):
+    try:
+        new_hash = await password_executor.run(pwd_context.hash, password)
+        # Only replace the hash we verified, not one changed in the meantime
+        result = await db.users.update_one(
+            {"id": user_id, "hashed_password": old_hash},
+            {"$set": {"hashed_password": new_hash}}
+        )
+    except ExecutorSaturated:
+        # Busy pool: leave it for the user's next login
+        rehash_stats["skipped"] += 1
+        return
+    except Exception as e:
+        rehash_stats["failed"] += 1
+        logger.error(f"Failed to re-hash password for user {user_id}: {str(e)}")
+        return
+    if result.modified_count:
+        rehash_stats["rehashed"] += 1
+
+def schedule_rehash(db: AsyncIOMotorDatabase, user: dict, password: str):
+    """Re-hash a just-verified password at the current cost without delaying the login"""
+    if not pwd_context.needs_update(user["hashed_password"]):
+        return
+    rehash_stats["scheduled"] += 1
+    task = asyncio.create_task(_rehash_password(db, user["id"], user["hashed_password"], password))
+    _rehash_tasks.add(task)
+    task.add_done_callback(_rehash_tasks.discard)
+
+_dummy_hash: Optional[str] = None
+
+async def verify_dummy_password(password: str):
+    """Spend the same hashing time, on the same pool, as verifying a real
+    account, so unknown emails cannot be told apart by response time"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        # Hashing costs as much as verifying, so the first call hashes instead
+        _dummy_hash = await get_password_hash(secrets.token_urlsafe(16))
+        return
+    await verify_password(password, _dummy_hash)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
@@ -46,34 +132,46 @@ async def get_user_by_id(db: AsyncIOMotorDatabase, user_id: str) -> Optional[dic
     """Get user from database by ID"""
     return await db.users.find_one({"id": user_id})
 
-async def authenticate_user(db: AsyncIOMotorDatabase, email: str, password: str, ip_address: str = None) -> Union[dict, bool]:
-    """Authenticate user with email and password"""
+async def _login_failed(db: AsyncIOMotorDatabase, email: str, ip_address: Optional[str], throttle_ip: Optional[str], reason: str, user: Optional[dict] = None):
+    """Charge a failed attempt to the throttle and the failed-login summary"""
+    await get_login_throttle().record_failure(throttle_ip, email)
+    await failed_login_log.record(db, email, ip_address, reason, user)
+
+async def authenticate_user(db: AsyncIOMotorDatabase, email: str, password: str, ip_address: str = None, user_agent: str = None, throttle_ip: Optional[str] = None) -> Union[dict, bool]:
+    """Authenticate user with email and password.
+
+    Attempts from an IP, or for an account from that IP, over the failure
+    limit are rejected with 429 before any lookup or hashing. throttle_ip
+    (see get_throttle_ip) defaults to ip_address.
+    """
+    throttle_ip = throttle_ip or ip_address
+    retry_after = await get_login_throttle().retry_after(throttle_ip, email)
+    if retry_after is not None:
+        await failed_login_log.record(db, email, ip_address, "throttled")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, please retry later",
+            headers={"Retry-After": str(retry_after)},
+        )
+    
+    # Every outcome below costs exactly one hash on the pool
     user = await get_user_by_email(db, email)
     if not user:
-        # Log failed login attempt
-        await log_activity(
-            db, None, email, ActivityType.FAILED_LOGIN,
-            f"Failed login attempt for {email} - user not found",
-            ip_address
-        )
+        await verify_dummy_password(password)
+        await _login_failed(db, email, ip_address, throttle_ip, UNKNOWN_ACCOUNT)
         return False
     
-    if not user.get("active", True):
-        await log_activity(
-            db, user["id"], email, ActivityType.FAILED_LOGIN,
-            f"Failed login attempt for {email} - user inactive",
-            ip_address
-        )
+    if not await verify_password(password, user["hashed_password"]):
+        await _login_failed(db, email, ip_address, throttle_ip, "invalid password", user)
         return False
     
-    if not verify_password(password, user["hashed_password"]):
-        await log_activity(
-            db, user["id"], email, ActivityType.FAILED_LOGIN,
-            f"Failed login attempt for {email} - invalid password",
-            ip_address
-        )
+    if not user.get("active", True):
+        await _login_failed(db, email, ip_address, throttle_ip, "user inactive", user)
         return False
     
+    await get_login_throttle().reset(throttle_ip, email)
+    schedule_rehash(db, user, password)
+    
     # Update last login
     await db.users.update_one(
         {"id": user["id"]},
@@ -84,13 +182,35 @@ async def authenticate_user(db: AsyncIOMotorDatabase, email: str, password: str,
     await log_activity(
         db, user["id"], email, ActivityType.LOGIN,
         f"Successful login for {email}",
-        ip_address
+        ip_address,
+        user_agent,
+        company_id=user.get("company_id")
     )
     
     return user
 
+def invalidate_user_sessions(user_id: str) -> int:
+    """Drop cached principals for a user after it is changed or deleted"""
+    return principal_cache.evict_where(lambda user: user.id == user_id)
+
+def invalidate_company_sessions(company_id: str) -> int:
+    """Drop cached principals for every user of a company"""
+    return principal_cache.evict_where(lambda user: user.company_id == company_id)
+
+def _cache_principal(token: str, user: User, payload: dict):
+    """Cache a resolved user without outliving the token's expiry"""
+    ttl = None
+    exp = payload.get("exp")
+    if exp is not None:
+        ttl = exp - time.time()
+    principal_cache.set(token, user, ttl)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get current authenticated user from JWT token"""
+    cached = principal_cache.get(credentials.credentials)
+    if cached is not None:
+        return cached
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -117,10 +237,16 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="User account is inactive"
         )
     
-    return User(**user)
+    current_user = User(**user)
+    _cache_principal(credentials.credentials, current_user, payload)
+    return current_user
 
 async def get_user_from_token(token: str, db: AsyncIOMotorDatabase) -> Optional[User]:
     """Validate a JWT token string and return the user if valid"""
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -132,7 +258,9 @@ async def get_user_from_token(token: str, db: AsyncIOMotorDatabase) -> Optional[
         if user is None or not user.get("active", True):
             return None
         
-        return User(**user)
+        current_user = User(**user)
+        _cache_principal(token, current_user, payload)
+        return current_user
     except JWTError:
         return None
 
@@ -159,3 +287,12 @@ def get_client_ip(request: Request) -> str:
     
     # Fall back to direct client
     return request.client.host if request.client else "unknown"
+
+def get_throttle_ip(request: Request) -> Optional[str]:
+    """Client address that login throttling is keyed on: the entry the
+    outermost trusted proxy appended to X-Forwarded-For, else the TCP peer"""
+    if TRUSTED_PROXY_HOPS > 0:
+        hops = [hop.strip() for hop in request.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else None
@@ -0,0 +1,57 @@
+"""
+Verify latency per bcrypt cost factor on this host, to choose BCRYPT_ROUNDS.
+
+Each cost is measured with one verify at a time and with every hashing
+worker busy, as during a login burst. Run from the backend directory:
+    python -m benchmarks.bcrypt_cost [min_rounds] [max_rounds] [p99_budget_ms]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from hash_executor import PASSWORD_HASH_WORKERS
+
+def _percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def _timed_verify(context: CryptContext, hashed: str) -> float:
+    start = time.perf_counter()
+    context.verify("correct horse battery staple", hashed)
+    return (time.perf_counter() - start) * 1000
+
+def measure(rounds: int, samples: int, workers: int):
+    """(p50, p99) verify latency in ms, alone and with `workers` verifies in parallel"""
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+    hashed = context.hash("correct horse battery staple")
+    alone = [_timed_verify(context, hashed) for _ in range(samples)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        loaded = list(pool.map(lambda _: _timed_verify(context, hashed), range(samples * workers)))
+    return (_percentile(alone, 0.5), _percentile(alone, 0.99)), (_percentile(loaded, 0.5), _percentile(loaded, 0.99))
+
+def main(min_rounds: int = 10, max_rounds: int = 14, budget_ms: float = 250.0):
+    workers = PASSWORD_HASH_WORKERS
+    print(f"bcrypt verify latency, {workers} hashing worker(s), p99 budget {budget_ms:.0f} ms")
+    print(f"  {'rounds':>6}  {'p50 ms':>8}  {'p99 ms':>8}  {'loaded p50':>10}  {'loaded p99':>10}")
+    chosen = None
+    for rounds in range(min_rounds, max_rounds + 1):
+        # Fewer samples at high cost keeps the run short
+        samples = max(5, 40 >> max(0, rounds - 10))
+        (p50, p99), (loaded_p50, loaded_p99) = measure(rounds, samples, workers)
+        print(f"  {rounds:>6}  {p50:8.1f}  {p99:8.1f}  {loaded_p50:10.1f}  {loaded_p99:10.1f}")
+        if loaded_p99 <= budget_ms:
+            chosen = rounds
+
+    if chosen is None:
+        print(f"No cost in range keeps loaded p99 under {budget_ms:.0f} ms")
+    else:
+        print(f"Highest cost within budget: BCRYPT_ROUNDS={chosen}")
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 14,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 250.0,
+    )
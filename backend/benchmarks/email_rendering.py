@@ -0,0 +1,36 @@
+"""
+Micro-benchmark for per-recipient email rendering.
+
+Run from the backend directory:
+    python -m benchmarks.email_rendering [recipients]
+"""
+import sys
+import time
+
+from email_templates import NEW_REPORT_EMAIL, NEW_REPORT_EMAIL_SOURCE, new_report_email_body
+
+REPORT = {
+    "report_title": "Encuesta Nacional - Intención de Voto",
+    "company_name": "Campaña Paloma Valencia",
+    "portal_url": "https://portal.insight-place.com",
+}
+
+def _per_recipient_us(render, recipients: int) -> float:
+    start = time.perf_counter()
+    for i in range(recipients):
+        render(f"Usuario {i}")
+    return (time.perf_counter() - start) / recipients * 1e6
+
+def main(recipients: int = 50000):
+    cases = {
+        "str.format, full template": lambda name: NEW_REPORT_EMAIL_SOURCE.format(user_name=name, **REPORT),
+        "compiled, all slots": lambda name: NEW_REPORT_EMAIL.render(user_name=name, **REPORT),
+        "compiled, cached report body": lambda name: new_report_email_body(**REPORT).render(user_name=name),
+    }
+
+    print(f"Rendering the new-report email for {recipients} recipients")
+    for label, render in cases.items():
+        print(f"  {label:<32} {_per_recipient_us(render, recipients):7.2f} us/recipient")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,67 @@
+"""
+Replay synthetic login and report view events through the password-sharing detector.
+
+Run from the backend directory:
+    python -m benchmarks.password_sharing [events] [users]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sharing import SharingDetector
+
+AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/126.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) Safari/605.1.15",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) Mobile/15E148",
+    "Mozilla/5.0 (X11; Linux x86_64) Firefox/127.0",
+    "Mozilla/5.0 (Linux; Android 14) Chrome/126.0 Mobile",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Edg/126.0",
+]
+
+def synthetic_events(events: int, users: int, shared_fraction: float = 0.02, seed: int = 7):
+    """Events 200 ms apart, about two days in total. Most users keep one
+    home IP and browser; a few share credentials across many networks and devices."""
+    rng = random.Random(seed)
+    shared = set(rng.sample(range(users), max(1, int(users * shared_fraction))))
+    home_ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}" for _ in range(users)]
+    start = datetime(2026, 1, 1)
+    for i in range(events):
+        user = rng.randrange(users)
+        if user in shared:
+            ip_address = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.0.{rng.randint(1, 254)}"
+            user_agent = rng.choice(AGENTS)
+        else:
+            ip_address = home_ips[user]
+            user_agent = AGENTS[user % len(AGENTS)]
+        yield {
+            "user_id": f"user-{user}",
+            "user_email": f"user{user}@example.com",
+            "activity_type": "login" if rng.random() < 0.2 else "report_view",
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "timestamp": start + timedelta(milliseconds=i * 200),
+        }
+
+def main(events: int = 1_000_000, users: int = 20_000):
+    print(f"Generating {events} events for {users} users")
+    replay = list(synthetic_events(events, users))
+
+    detector = SharingDetector(max_users=users, flush_interval=0)
+    started = time.perf_counter()
+    for activity in replay:
+        detector.observe(activity)
+    elapsed = time.perf_counter() - started
+
+    stats = detector.stats()
+    print(f"  replayed in {elapsed:.2f} s  ({events / elapsed:,.0f} events/s, "
+          f"{elapsed / events * 1e6:.2f} us/event)")
+    print(f"  tracked users {stats['tracked_users']}, flags raised {stats['flags_raised']}, "
+          f"flagged accounts {stats['pending']}")
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20_000,
+    )
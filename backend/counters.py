@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from models import ReportStatus
+
+logger = logging.getLogger(__name__)
+
+# How often the stored counters are replaced with real counts
+DASHBOARD_RECONCILE_INTERVAL = float(os.environ.get("DASHBOARD_RECONCILE_INTERVAL", "300"))
+
+# Counter names, stored as _id in db.counters
+ACTIVE_COMPANIES = "active_companies"
+ACTIVE_USERS = "active_users"
+PUBLISHED_REPORTS = "published_reports"
+ACTIVITY_LOGS = "activity_logs"
+COUNTER_NAMES = (ACTIVE_COMPANIES, ACTIVE_USERS, PUBLISHED_REPORTS, ACTIVITY_LOGS)
+
+async def count_all(db: AsyncIOMotorDatabase) -> Dict[str, int]:
+    """Real counts, queried concurrently"""
+    values = await asyncio.gather(
+        db.companies.count_documents({"active": True}),
+        db.users.count_documents({"active": True}),
+        db.reports.count_documents({"status": ReportStatus.PUBLISHED}),
+        # Unfiltered, so collection metadata answers it without a scan
+        db.activity_logs.estimated_document_count(),
+    )
+    return dict(zip(COUNTER_NAMES, values))
+
+class DashboardCounters:
+    """Dashboard totals kept in db.counters, adjusted by the code paths that
+    change them and periodically reconciled against real counts"""
+
+    def __init__(self, reconcile_interval: float):
+        self.reconcile_interval = reconcile_interval
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self.reconciliations = 0
+        self.last_drift: Dict[str, int] = {}
+        self.fallbacks = 0
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def increment(self, db: AsyncIOMotorDatabase, name: str, delta: int = 1):
+        """Adjust a counter; counters are created by the first reconciliation"""
+        if delta:
+            await db.counters.update_one({"_id": name}, {"$inc": {"value": delta}})
+
+    async def snapshot(self, db: AsyncIOMotorDatabase) -> Dict[str, int]:
+        """Current totals, from the counters when present, else counted directly"""
+        docs = await db.counters.find({"_id": {"$in": list(COUNTER_NAMES)}}).to_list(length=len(COUNTER_NAMES))
+        values = {doc["_id"]: doc["value"] for doc in docs}
+        if len(values) == len(COUNTER_NAMES):
+            return values
+        self.fallbacks += 1
+        return await count_all(db)
+
+    async def reconcile(self, db: AsyncIOMotorDatabase) -> Dict[str, int]:
+        """Overwrite the counters with real counts, returning the drift found.
+
+        Increments that land between the count and the write are absorbed
+        into the next reconciliation.
+        """
+        actual = await count_all(db)
+        docs = await db.counters.find({"_id": {"$in": list(COUNTER_NAMES)}}).to_list(length=len(COUNTER_NAMES))
+        stored = {doc["_id"]: doc["value"] for doc in docs}
+        now = datetime.utcnow()
+        for name, value in actual.items():
+            await db.counters.update_one(
+                {"_id": name},
+                {"$set": {"value": value, "reconciled_at": now}},
+                upsert=True
+            )
+        drift = {name: stored[name] - value for name, value in actual.items()
+                 if name in stored and stored[name] != value}
+        if drift:
+            logger.info(f"Dashboard counters corrected: {drift}")
+        self.last_drift = drift
+        self.reconciliations += 1
+        return drift
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile(self._db)
+            except Exception as e:
+                logger.error(f"Dashboard counter reconciliation failed: {str(e)}")
+            await asyncio.sleep(self.reconcile_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "reconcile_interval": self.reconcile_interval,
+            "reconciliations": self.reconciliations,
+            "last_drift": self.last_drift,
+            "fallbacks": self.fallbacks,
+        }
+
+# Shared counters, reconciled by the server lifespan
+dashboard_counters = DashboardCounters(DASHBOARD_RECONCILE_INTERVAL)
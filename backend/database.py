@@ -10,6 +10,22 @@ load_dotenv(ROOT_DIR / '.env')
 MONGO_URL = os.environ['MONGO_URL']
 DB_NAME = os.environ.get('DB_NAME', 'insightplace')
 
+# Equality-field prefixes of the activity log compound indexes
+ACTIVITY_LOG_INDEX_PREFIXES = [
+    (),
+    ("user_id",),
+    ("user_id", "activity_type"),
+    ("activity_type",),
+    ("ip_address",),
+    ("ip_address", "activity_type"),
+    ("metadata.report_id",),
+    ("metadata.report_id", "activity_type"),
+]
+# Single-field indexes from before the compound ones; each is a prefix of a
+# compound index (or, for timestamp, covered by the () entry above), so they
+# only cost a write per insert
+SUPERSEDED_ACTIVITY_LOG_INDEXES = ["user_id_1", "timestamp_1", "activity_type_1", "ip_address_1"]
+
 # Global client instance
 client: AsyncIOMotorClient = None
 database: AsyncIOMotorDatabase = None
@@ -41,21 +57,69 @@ async def create_indexes():
     await database.users.create_index("email", unique=True)
     await database.users.create_index("company_id")
     await database.users.create_index("active")
+    # Keyset pagination order, alone and within a company
+    await database.users.create_index([("created_at", -1), ("id", -1)])
+    await database.users.create_index([("company_id", 1), ("created_at", -1), ("id", -1)])
     
     # Company indexes
     await database.companies.create_index("name", unique=True)
     await database.companies.create_index("active")
+    await database.companies.create_index([("created_at", -1), ("id", -1)])
     
     # Report indexes
     await database.reports.create_index("company_id")
     await database.reports.create_index("status")
     await database.reports.create_index("created_at")
     await database.reports.create_index("title")
+    await database.reports.create_index("tags")
+    await database.reports.create_index([("created_at", -1), ("id", -1)])
+    await database.reports.create_index([("company_id", 1), ("status", 1), ("created_at", -1), ("id", -1)])
     
     # Activity log indexes
-    await database.activity_logs.create_index("user_id")
-    await database.activity_logs.create_index("timestamp")
-    await database.activity_logs.create_index("activity_type")
-    await database.activity_logs.create_index("ip_address")
+    # Activity log queries filter on equality fields and page on (timestamp, id),
+    # so each index ends with the sort keys and no query needs an in-memory sort
+    for prefix in ACTIVITY_LOG_INDEX_PREFIXES:
+        await database.activity_logs.create_index(
+            [(field, 1) for field in prefix] + [("timestamp", -1), ("id", -1)]
+        )
+    existing = await database.activity_logs.index_information()
+    for name in SUPERSEDED_ACTIVITY_LOG_INDEXES:
+        if name in existing:
+            await database.activity_logs.drop_index(name)
+    
+    # Activity rollups: the unique keys are upserted per batch and by the backfill
+    await database.activity_rollups.create_index(
+        [("granularity", 1), ("bucket", 1), ("company_id", 1), ("report_id", 1), ("activity_type", 1)],
+        unique=True
+    )
+    await database.activity_rollups.create_index([("granularity", 1), ("company_id", 1), ("bucket", 1)])
+    await database.activity_rollups.create_index([("granularity", 1), ("report_id", 1), ("bucket", 1)])
+    await database.ip_rollups.create_index(
+        [("granularity", 1), ("bucket", 1), ("ip_address", 1), ("activity_type", 1)],
+        unique=True
+    )
+    await database.ip_rollups.create_index([("granularity", 1), ("ip_address", 1), ("bucket", 1)])
+    
+    # Password-sharing flags, listed most recently flagged first
+    await database.sharing_flags.create_index("id", unique=True)
+    await database.sharing_flags.create_index([("last_flagged_at", -1), ("id", -1)])
+    
+    # Shared failed-login counters (LOGIN_THROTTLE_STORE=mongo)
+    await database.login_failures.create_index([("key", 1), ("window", 1)], unique=True)
+    await database.login_failures.create_index("expires_at", expireAfterSeconds=0)
+    
+    # Ingestion job indexes
+    await database.ingestion_jobs.create_index("id", unique=True)
+    await database.ingestion_jobs.create_index([("status", 1), ("created_at", 1)])
+    
+    # Email outbox indexes
+    await database.email_outbox.create_index("id", unique=True)
+    await database.email_outbox.create_index([("status", 1), ("next_attempt_at", 1)])
+    await database.email_outbox.create_index([("status", 1), ("lease_until", 1)])
+    await database.email_outbox.create_index([("status", 1), ("sent_at", 1)])
+    
+    # View token indexes (TTL index expires tokens for the shared store)
+    await database.view_tokens.create_index("token", unique=True)
+    await database.view_tokens.create_index("expiry", expireAfterSeconds=0)
     
     print("Database indexes created")
@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from email_service import email_dispatcher, get_welcome_email_html
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "2"))
+# How long a claimed message is owned before another worker may retry it
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_RETRY_BACKOFF = float(os.environ.get("OUTBOX_RETRY_BACKOFF", "30"))
+
+# Message states
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+SKIPPED = "skipped"
+DEAD = "dead"
+
+# Messages stored as a template name and params are rendered at send time.
+# Secret params (an initial password) never reach Mongo; when the process
+# holding them is gone, the fallback is rendered in their place.
+OUTBOX_TEMPLATES = {
+    "welcome": get_welcome_email_html,
+}
+OUTBOX_SECRET_FALLBACKS = {
+    "password": "solicítala a tu administrador",
+}
+
+def new_outbox_message(
+    recipient_email: str,
+    subject: str,
+    html_content: Optional[str],
+    kind: str,
+    message_id: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+    template: Optional[str] = None,
+    params: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Build an outbox document from rendered HTML, or from a template in
+    OUTBOX_TEMPLATES and its params (html_content None). Pass a deterministic
+    message_id to make enqueueing idempotent."""
+    now = datetime.utcnow()
+    return {
+        "id": message_id or str(uuid.uuid4()),
+        "kind": kind,
+        "to": recipient_email,
+        "subject": subject,
+        "html": html_content,
+        "template": template,
+        "params": params or {},
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "lease_until": None,
+        "last_error": None,
+        "email_id": None,
+        "metadata": metadata or {},
+        "created_at": now,
+        "updated_at": now,
+        "sent_at": None,
+    }
+
+class EmailOutboxWorker:
+    """Claims outbox messages with leases and delivers them through the email dispatcher"""
+
+    def __init__(self, batch_size: int, poll_interval: float, lease_seconds: int,
+                 max_attempts: int, retry_backoff: float):
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # message id -> template params kept out of the database
+        self._secrets: Dict[str, Dict[str, Any]] = {}
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self.skipped = 0
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop polling; claimed messages are retried once their lease expires"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def enqueue(
+        self,
+        db: AsyncIOMotorDatabase,
+        messages: List[Dict[str, Any]],
+        secrets: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> int:
+        """Store messages in the outbox, ignoring ids that were already enqueued.
+        secrets maps message ids to template params held only in memory."""
+        if not messages:
+            return 0
+        self._secrets.update(secrets or {})
+        try:
+            result = await db.email_outbox.insert_many(messages, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return inserted
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await self._drain_once()
+            except Exception as e:
+                logger.error(f"Email outbox cycle failed: {str(e)}")
+                delivered = 0
+            if delivered:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await self._db.email_outbox.find_one_and_update(
+            {
+                "$or": [
+                    {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                    {"status": SENDING, "lease_until": {"$lt": now}},
+                ]
+            },
+            {
+                "$set": {
+                    "status": SENDING,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _render(self, message: Dict[str, Any]) -> str:
+        if message.get("html") is not None or not message.get("template"):
+            return message.get("html") or ""
+        params = dict(message.get("params") or {})
+        secrets = self._secrets.get(message["id"])
+        if secrets is None:
+            params.update(OUTBOX_SECRET_FALLBACKS)
+        else:
+            params.update(secrets)
+        return OUTBOX_TEMPLATES[message["template"]](**params)
+
+    async def _drain_once(self) -> int:
+        """Claim and send one batch; returns the number of messages handled"""
+        claimed = []
+        while len(claimed) < self.batch_size:
+            message = await self._claim()
+            if message is None:
+                break
+            claimed.append(message)
+        if not claimed:
+            return 0
+
+        results = await email_dispatcher.send_many([
+            {"to": m["to"], "subject": m["subject"], "html": self._render(m)} for m in claimed
+        ])
+
+        now = datetime.utcnow()
+        for message, result in zip(claimed, results):
+            if result["status"] in ("success", "skipped") or message["attempts"] >= self.max_attempts:
+                self._secrets.pop(message["id"], None)
+            if result["status"] in ("success", "skipped"):
+                final_status = SENT if result["status"] == "success" else SKIPPED
+                # Bodies are not needed once delivered
+                await self._db.email_outbox.update_one(
+                    {"id": message["id"]},
+                    {
+                        "$set": {"status": final_status, "sent_at": now, "updated_at": now,
+                                 "email_id": result.get("email_id"), "lease_until": None},
+                        "$unset": {"html": ""}
+                    }
+                )
+                if final_status == SENT:
+                    self.sent += 1
+                else:
+                    self.skipped += 1
+            elif message["attempts"] >= self.max_attempts:
+                await self._db.email_outbox.update_one(
+                    {"id": message["id"]},
+                    {
+                        "$set": {"status": DEAD, "last_error": result.get("message"),
+                                 "updated_at": now, "lease_until": None},
+                        "$unset": {"html": ""}
+                    }
+                )
+                self.dead += 1
+                logger.error(f"Email to {message['to']} dead-lettered after {message['attempts']} attempts")
+            else:
+                delay = self.retry_backoff * (2 ** (message["attempts"] - 1))
+                await self._db.email_outbox.update_one(
+                    {"id": message["id"]},
+                    {"$set": {"status": PENDING, "last_error": result.get("message"),
+                              "next_attempt_at": now + timedelta(seconds=delay),
+                              "updated_at": now, "lease_until": None}}
+                )
+                self.retried += 1
+
+        return len(claimed)
+
+    async def summary(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        """Backlog and throughput figures for the admin dashboard"""
+        now = datetime.utcnow()
+        counts = {PENDING: 0, SENDING: 0, SENT: 0, SKIPPED: 0, DEAD: 0}
+        async for row in db.email_outbox.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+
+        oldest = await db.email_outbox.find_one(
+            {"status": {"$in": [PENDING, SENDING]}}, {"created_at": 1}, sort=[("created_at", 1)]
+        )
+        sent_last_hour = await db.email_outbox.count_documents(
+            {"status": SENT, "sent_at": {"$gte": now - timedelta(hours=1)}}
+        )
+
+        return {
+            "counts": counts,
+            "backlog": counts[PENDING] + counts[SENDING],
+            "oldest_pending_seconds": int((now - oldest["created_at"]).total_seconds()) if oldest else 0,
+            "sent_last_hour": sent_last_hour,
+            "worker": self.stats(),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "retried": self.retried,
+            "dead": self.dead,
+        }
+
+# Shared worker started by the server lifespan
+outbox_worker = EmailOutboxWorker(
+    OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_LEASE_SECONDS,
+    OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BACKOFF
+)
@@ -1,9 +1,13 @@
 import os
 import asyncio
 import logging
+import random
+import time
 import resend
 from dotenv import load_dotenv
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+
+from email_templates import WELCOME_EMAIL, new_report_email_body
 
 load_dotenv()
 
@@ -13,126 +17,222 @@ logger = logging.getLogger(__name__)
 resend.api_key = os.environ.get("RESEND_API_KEY", "")
 SENDER_EMAIL = os.environ.get("SENDER_EMAIL", "contacto@insight-place.com")
 
+# Portal URL for email links
+PORTAL_URL = os.environ.get("PORTAL_URL", "https://secure-report-viewer.preview.emergentagent.com")
+
+# Dispatcher tuning: parallel requests, provider rate limit and retry policy
+EMAIL_CONCURRENCY = int(os.environ.get("EMAIL_CONCURRENCY", "4"))
+EMAIL_RATE_LIMIT = float(os.environ.get("EMAIL_RATE_LIMIT", "2"))  # API requests per second
+EMAIL_MAX_RETRIES = int(os.environ.get("EMAIL_MAX_RETRIES", "3"))
+EMAIL_RETRY_BACKOFF = float(os.environ.get("EMAIL_RETRY_BACKOFF", "0.5"))
+# Resend accepts up to 100 messages per batch request
+EMAIL_BATCH_SIZE = int(os.environ.get("EMAIL_BATCH_SIZE", "100"))
+
+class ResendTransport:
+    """Sends messages through the Resend API"""
+
+    supports_batch = hasattr(resend, "Batch")
+
+    @property
+    def configured(self) -> bool:
+        return bool(resend.api_key)
+
+    async def send(self, params: Dict[str, Any]) -> Optional[str]:
+        email = await asyncio.to_thread(resend.Emails.send, params)
+        return email.get("id")
+
+    async def send_batch(self, params: List[Dict[str, Any]]) -> List[Optional[str]]:
+        response = await asyncio.to_thread(resend.Batch.send, params)
+        return [item.get("id") for item in response.get("data", [])]
+
+class FakeTransport:
+    """In-memory transport for tests and local development"""
+
+    def __init__(self, supports_batch: bool = True, failures: int = 0, error: Optional[Exception] = None):
+        self.supports_batch = supports_batch
+        self.configured = True
+        self.failures = failures  # Number of upcoming calls that raise
+        self.error = error or ConnectionError("Simulated transport failure")
+        self.sent: List[Dict[str, Any]] = []
+        self.calls = 0
+
+    def _maybe_fail(self):
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise self.error
+
+    async def send(self, params: Dict[str, Any]) -> Optional[str]:
+        self._maybe_fail()
+        self.sent.append(params)
+        return f"fake-{len(self.sent)}"
+
+    async def send_batch(self, params: List[Dict[str, Any]]) -> List[Optional[str]]:
+        self._maybe_fail()
+        ids = []
+        for message in params:
+            self.sent.append(message)
+            ids.append(f"fake-{len(self.sent)}")
+        return ids
+
+class TokenBucket:
+    """Async token bucket limiting API requests per second"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+def _is_retryable(error: Exception) -> bool:
+    """Retry connection failures, timeouts, rate limiting and server errors.
+    Bad requests and anything else (including bugs) fail on the first attempt."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if not isinstance(error, resend.exceptions.ResendError):
+        return False
+    # The SDK reports HTTP client failures as ResendError with code 500
+    try:
+        code = int(error.code)
+    except (TypeError, ValueError):
+        return False
+    return code == 429 or code >= 500
+
+class EmailDispatcher:
+    """Concurrent, rate-limited email sender with retries and per-recipient results"""
+
+    def __init__(self, transport, concurrency: int, rate: float, max_retries: int,
+                 backoff: float, batch_size: int):
+        self.transport = transport
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.batch_size = max(1, min(batch_size, 100))
+        self._bucket = TokenBucket(rate)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def _call(self, func, payload):
+        """Call the transport under the rate limit, retrying with backoff"""
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._bucket.acquire()
+            try:
+                async with self._get_semaphore():
+                    return await func(payload), attempt
+            except Exception as e:
+                if attempt > self.max_retries or not _is_retryable(e):
+                    e.attempts = attempt
+                    raise
+                delay = self.backoff * (2 ** (attempt - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay))
+
+    async def _send_one(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        recipient = message["to"][0]
+        try:
+            email_id, attempts = await self._call(self.transport.send, message)
+        except Exception as e:
+            logger.error(f"Failed to send email to {recipient}: {str(e)}")
+            return {"email": recipient, "status": "error", "message": str(e),
+                    "attempts": getattr(e, "attempts", 1)}
+        logger.info(f"Email sent to {recipient}")
+        return {"email": recipient, "status": "success", "message": f"Email enviado a {recipient}",
+                "email_id": email_id, "attempts": attempts}
+
+    async def _send_batch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        try:
+            email_ids, attempts = await self._call(self.transport.send_batch, messages)
+        except Exception as e:
+            logger.error(f"Failed to send email batch of {len(messages)}: {str(e)}")
+            return [{"email": m["to"][0], "status": "error", "message": str(e),
+                     "attempts": getattr(e, "attempts", 1)} for m in messages]
+        logger.info(f"Email batch of {len(messages)} sent")
+        email_ids = list(email_ids) + [None] * (len(messages) - len(email_ids))
+        return [{"email": m["to"][0], "status": "success", "message": f"Email enviado a {m['to'][0]}",
+                 "email_id": email_id, "attempts": attempts} for m, email_id in zip(messages, email_ids)]
+
+    async def send_many(self, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """Send messages ({"to", "subject", "html"}) and return one result per recipient"""
+        if not self.transport.configured:
+            logger.warning("RESEND_API_KEY not configured, skipping email")
+            return [{"email": m["to"], "status": "skipped", "message": "Email service not configured"}
+                    for m in messages]
+
+        params = [{
+            "from": SENDER_EMAIL,
+            "to": [m["to"]],
+            "subject": m["subject"],
+            "html": m["html"]
+        } for m in messages]
+
+        if self.transport.supports_batch and len(params) > 1:
+            chunks = [params[i:i + self.batch_size] for i in range(0, len(params), self.batch_size)]
+            batches = await asyncio.gather(*(self._send_batch(chunk) for chunk in chunks))
+            return [result for batch in batches for result in batch]
+
+        return list(await asyncio.gather(*(self._send_one(p) for p in params)))
+
+# Shared dispatcher; tests can swap in FakeTransport via email_dispatcher.transport
+email_dispatcher = EmailDispatcher(
+    ResendTransport(), EMAIL_CONCURRENCY, EMAIL_RATE_LIMIT,
+    EMAIL_MAX_RETRIES, EMAIL_RETRY_BACKOFF, EMAIL_BATCH_SIZE
+)
+
 async def send_email(
     recipient_email: str,
     subject: str,
     html_content: str
 ) -> dict:
     """Send a single email"""
-    if not resend.api_key:
-        logger.warning("RESEND_API_KEY not configured, skipping email")
-        return {"status": "skipped", "message": "Email service not configured"}
-    
-    params = {
-        "from": SENDER_EMAIL,
-        "to": [recipient_email],
-        "subject": subject,
-        "html": html_content
-    }
-    
-    try:
-        email = await asyncio.to_thread(resend.Emails.send, params)
-        logger.info(f"Email sent to {recipient_email}")
-        return {
-            "status": "success",
-            "message": f"Email enviado a {recipient_email}",
-            "email_id": email.get("id")
-        }
-    except Exception as e:
-        logger.error(f"Failed to send email to {recipient_email}: {str(e)}")
-        return {"status": "error", "message": str(e)}
+    results = await email_dispatcher.send_many([
+        {"to": recipient_email, "subject": subject, "html": html_content}
+    ])
+    result = results[0]
+    result.pop("email", None)
+    return result
 
 async def send_email_bulk(
     recipient_emails: List[str],
     subject: str,
     html_content: str
 ) -> List[dict]:
-    """Send emails to multiple recipients"""
-    results = []
-    for email in recipient_emails:
-        result = await send_email(email, subject, html_content)
-        results.append({"email": email, **result})
-    return results
+    """Send the same email to multiple recipients concurrently"""
+    return await email_dispatcher.send_many([
+        {"to": email, "subject": subject, "html": html_content}
+        for email in recipient_emails
+    ])
+
+async def send_personalized_emails(messages: List[Dict[str, str]]) -> List[dict]:
+    """Send individually rendered emails ({"to", "subject", "html"}) concurrently"""
+    return await email_dispatcher.send_many(messages)
 
 def get_welcome_email_html(user_name: str, user_email: str, password: str, company_name: str, portal_url: str) -> str:
     """Generate welcome email HTML for new users"""
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-    </head>
-    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-        <div style="background-color: #dc2626; padding: 20px; text-align: center; border-radius: 8px 8px 0 0;">
-            <h1 style="color: white; margin: 0;">InsightPlace</h1>
-            <p style="color: white; margin: 5px 0 0 0;">Portal de Clientes</p>
-        </div>
-        
-        <div style="background-color: #f9fafb; padding: 30px; border: 1px solid #e5e7eb; border-top: none; border-radius: 0 0 8px 8px;">
-            <h2 style="color: #1f2937; margin-top: 0;">¡Bienvenido/a, {user_name}!</h2>
-            
-            <p>Se ha creado tu cuenta en el <strong>Portal de Clientes de InsightPlace</strong> para la empresa <strong>{company_name}</strong>.</p>
-            
-            <p>A través de este portal podrás acceder a los reportes y análisis confidenciales preparados exclusivamente para tu organización.</p>
-            
-            <div style="background-color: white; padding: 20px; border-radius: 8px; border: 1px solid #e5e7eb; margin: 20px 0;">
-                <h3 style="margin-top: 0; color: #1f2937;">Tus credenciales de acceso:</h3>
-                <p style="margin: 5px 0;"><strong>Correo electrónico:</strong> {user_email}</p>
-                <p style="margin: 5px 0;"><strong>Contraseña:</strong> {password}</p>
-            </div>
-            
-            <p style="color: #dc2626;"><strong>Importante:</strong> Te recomendamos cambiar tu contraseña después de iniciar sesión por primera vez.</p>
-            
-            <div style="text-align: center; margin: 30px 0;">
-                <a href="{portal_url}/login" style="background-color: #dc2626; color: white; padding: 12px 30px; text-decoration: none; border-radius: 6px; font-weight: bold;">Acceder al Portal</a>
-            </div>
-            
-            <p style="color: #6b7280; font-size: 14px;">Si tienes alguna pregunta, no dudes en contactarnos.</p>
-        </div>
-        
-        <div style="text-align: center; padding: 20px; color: #9ca3af; font-size: 12px;">
-            <p>© 2024 InsightPlace. Todos los derechos reservados.</p>
-            <p>Este correo fue enviado desde contacto@insight-place.com</p>
-        </div>
-    </body>
-    </html>
-    """
+    return WELCOME_EMAIL.render(
+        user_name=user_name, user_email=user_email, password=password,
+        company_name=company_name, portal_url=portal_url
+    )
 
 def get_new_report_email_html(user_name: str, report_title: str, company_name: str, portal_url: str) -> str:
-    """Generate new report notification email HTML"""
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-    </head>
-    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-        <div style="background-color: #dc2626; padding: 20px; text-align: center; border-radius: 8px 8px 0 0;">
-            <h1 style="color: white; margin: 0;">InsightPlace</h1>
-            <p style="color: white; margin: 5px 0 0 0;">Portal de Clientes</p>
-        </div>
-        
-        <div style="background-color: #f9fafb; padding: 30px; border: 1px solid #e5e7eb; border-top: none; border-radius: 0 0 8px 8px;">
-            <h2 style="color: #1f2937; margin-top: 0;">Hola, {user_name}</h2>
-            
-            <p>Se ha publicado un nuevo reporte para <strong>{company_name}</strong>:</p>
-            
-            <div style="background-color: white; padding: 20px; border-radius: 8px; border: 1px solid #e5e7eb; margin: 20px 0; border-left: 4px solid #dc2626;">
-                <h3 style="color: #1f2937; margin: 0 0 10px 0;">{report_title}</h3>
-                <p style="color: #6b7280; margin: 0;">Disponible en tu portal</p>
-            </div>
-            
-            <div style="text-align: center; margin: 30px 0;">
-                <a href="{portal_url}/login" style="background-color: #dc2626; color: white; padding: 12px 30px; text-decoration: none; border-radius: 6px; font-weight: bold;">Ver Reporte</a>
-            </div>
-            
-            <p style="color: #6b7280; font-size: 14px;">Accede al portal para consultar el reporte completo.</p>
-        </div>
-        
-        <div style="text-align: center; padding: 20px; color: #9ca3af; font-size: 12px;">
-            <p>© 2024 InsightPlace. Todos los derechos reservados.</p>
-            <p>Este correo fue enviado desde contacto@insight-place.com</p>
-        </div>
-    </body>
-    </html>
-    """
+    """Generate new report notification email HTML.
+    The shared body is rendered once per (report, company); only the name is spliced per recipient."""
+    return new_report_email_body(report_title, company_name, portal_url).render(user_name=user_name)
@@ -0,0 +1,130 @@
+import re
+from functools import lru_cache
+from typing import List
+
+class CompiledTemplate:
+    """Template split once into static text and {slot} placeholders.
+
+    Rendering only joins the precomputed static parts with slot values, and
+    partial() binds some slots up front so shared content is spliced once.
+    """
+
+    _SLOT = re.compile(r"\{(\w+)\}")
+
+    def __init__(self, statics: List[str], slots: List[str]):
+        self.statics = statics
+        self.slots = slots
+
+    @classmethod
+    def compile(cls, source: str) -> "CompiledTemplate":
+        parts = cls._SLOT.split(source)
+        return cls(parts[0::2], parts[1::2])
+
+    def render(self, **values: str) -> str:
+        out = [self.statics[0]]
+        for slot, static in zip(self.slots, self.statics[1:]):
+            out.append(str(values[slot]))
+            out.append(static)
+        return "".join(out)
+
+    def partial(self, **values: str) -> "CompiledTemplate":
+        """Bind the given slots and merge them into the static text"""
+        statics = [self.statics[0]]
+        slots = []
+        for slot, static in zip(self.slots, self.statics[1:]):
+            if slot in values:
+                statics[-1] += str(values[slot]) + static
+            else:
+                slots.append(slot)
+                statics.append(static)
+        return CompiledTemplate(statics, slots)
+
+WELCOME_EMAIL_SOURCE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+    </head>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+        <div style="background-color: #dc2626; padding: 20px; text-align: center; border-radius: 8px 8px 0 0;">
+            <h1 style="color: white; margin: 0;">InsightPlace</h1>
+            <p style="color: white; margin: 5px 0 0 0;">Portal de Clientes</p>
+        </div>
+        
+        <div style="background-color: #f9fafb; padding: 30px; border: 1px solid #e5e7eb; border-top: none; border-radius: 0 0 8px 8px;">
+            <h2 style="color: #1f2937; margin-top: 0;">¡Bienvenido/a, {user_name}!</h2>
+            
+            <p>Se ha creado tu cuenta en el <strong>Portal de Clientes de InsightPlace</strong> para la empresa <strong>{company_name}</strong>.</p>
+            
+            <p>A través de este portal podrás acceder a los reportes y análisis confidenciales preparados exclusivamente para tu organización.</p>
+            
+            <div style="background-color: white; padding: 20px; border-radius: 8px; border: 1px solid #e5e7eb; margin: 20px 0;">
+                <h3 style="margin-top: 0; color: #1f2937;">Tus credenciales de acceso:</h3>
+                <p style="margin: 5px 0;"><strong>Correo electrónico:</strong> {user_email}</p>
+                <p style="margin: 5px 0;"><strong>Contraseña:</strong> {password}</p>
+            </div>
+            
+            <p style="color: #dc2626;"><strong>Importante:</strong> Te recomendamos cambiar tu contraseña después de iniciar sesión por primera vez.</p>
+            
+            <div style="text-align: center; margin: 30px 0;">
+                <a href="{portal_url}/login" style="background-color: #dc2626; color: white; padding: 12px 30px; text-decoration: none; border-radius: 6px; font-weight: bold;">Acceder al Portal</a>
+            </div>
+            
+            <p style="color: #6b7280; font-size: 14px;">Si tienes alguna pregunta, no dudes en contactarnos.</p>
+        </div>
+        
+        <div style="text-align: center; padding: 20px; color: #9ca3af; font-size: 12px;">
+            <p>© 2024 InsightPlace. Todos los derechos reservados.</p>
+            <p>Este correo fue enviado desde contacto@insight-place.com</p>
+        </div>
+    </body>
+    </html>
+    """
+
+NEW_REPORT_EMAIL_SOURCE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+    </head>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+        <div style="background-color: #dc2626; padding: 20px; text-align: center; border-radius: 8px 8px 0 0;">
+            <h1 style="color: white; margin: 0;">InsightPlace</h1>
+            <p style="color: white; margin: 5px 0 0 0;">Portal de Clientes</p>
+        </div>
+        
+        <div style="background-color: #f9fafb; padding: 30px; border: 1px solid #e5e7eb; border-top: none; border-radius: 0 0 8px 8px;">
+            <h2 style="color: #1f2937; margin-top: 0;">Hola, {user_name}</h2>
+            
+            <p>Se ha publicado un nuevo reporte para <strong>{company_name}</strong>:</p>
+            
+            <div style="background-color: white; padding: 20px; border-radius: 8px; border: 1px solid #e5e7eb; margin: 20px 0; border-left: 4px solid #dc2626;">
+                <h3 style="color: #1f2937; margin: 0 0 10px 0;">{report_title}</h3>
+                <p style="color: #6b7280; margin: 0;">Disponible en tu portal</p>
+            </div>
+            
+            <div style="text-align: center; margin: 30px 0;">
+                <a href="{portal_url}/login" style="background-color: #dc2626; color: white; padding: 12px 30px; text-decoration: none; border-radius: 6px; font-weight: bold;">Ver Reporte</a>
+            </div>
+            
+            <p style="color: #6b7280; font-size: 14px;">Accede al portal para consultar el reporte completo.</p>
+        </div>
+        
+        <div style="text-align: center; padding: 20px; color: #9ca3af; font-size: 12px;">
+            <p>© 2024 InsightPlace. Todos los derechos reservados.</p>
+            <p>Este correo fue enviado desde contacto@insight-place.com</p>
+        </div>
+    </body>
+    </html>
+    """
+
+# Compiled once at import time
+WELCOME_EMAIL = CompiledTemplate.compile(WELCOME_EMAIL_SOURCE)
+NEW_REPORT_EMAIL = CompiledTemplate.compile(NEW_REPORT_EMAIL_SOURCE)
+
+@lru_cache(maxsize=256)
+def new_report_email_body(report_title: str, company_name: str, portal_url: str) -> CompiledTemplate:
+    """New-report email with everything but the recipient name filled in"""
+    return NEW_REPORT_EMAIL.partial(
+        report_title=report_title, company_name=company_name, portal_url=portal_url
+    )
@@ -0,0 +1,443 @@
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from starlette.types import Receive, Scope, Send
+
+# Asset URLs are not content-addressed (a re-upload under the same title
+# replaces the files in place), so clients revalidate on every use; the
+# content-hash ETag makes that a cheap 304.
+REPORT_ASSET_CACHE_CONTROL = os.environ.get(
+    "REPORT_ASSET_CACHE_CONTROL", "private, no-cache"
+)
+# Assets without a content hash (reports ingested before the manifest existed)
+# are revalidated on every use instead.
+LEGACY_ASSET_CACHE_CONTROL = "private, no-cache"
+NO_STORE_CACHE_CONTROL = "no-store, no-cache, must-revalidate, private"
+
+# "none" streams files from Python (via pathsend when the ASGI server offers it);
+# "x-accel" (nginx) and "x-sendfile" (Apache, lighttpd) authorize the request
+# and leave the transfer to the front proxy.
+FILE_OFFLOAD_MODE = os.environ.get("FILE_OFFLOAD_MODE", "none").lower()
+# Directory the proxy serves from, and the internal location mapped onto it
+FILE_OFFLOAD_ROOT = Path(os.environ.get("FILE_OFFLOAD_ROOT", "/app/uploads"))
+FILE_OFFLOAD_PREFIX = os.environ.get("FILE_OFFLOAD_PREFIX", "/protected-uploads/")
+
+CONTENT_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".svg": "image/svg+xml",
+    ".css": "text/css",
+    ".js": "application/javascript",
+    ".json": "application/json",
+    ".html": "text/html",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".ttf": "font/ttf",
+    ".eot": "application/vnd.ms-fontobject",
+}
+
+# Types worth serving precompressed; images and fonts are compressed already
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/css", "application/javascript", "application/json", "image/svg+xml",
+}
+# Precompressed siblings, in server preference order
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+def guess_content_type(path: Path) -> str:
+    """Content type for a report asset based on its extension"""
+    return CONTENT_TYPES.get(path.suffix.lower(), "application/octet-stream")
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison as required for If-None-Match"""
+    if header.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+def negotiate_encoding(request: Request, available: Dict[str, int]) -> Optional[str]:
+    """Pick a precompressed coding the client accepts, preferring br, then gzip"""
+    header = request.headers.get("accept-encoding")
+    if not header or not available:
+        return None
+
+    weights = {}
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in ENCODING_SUFFIXES:
+        if encoding not in available:
+            continue
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+
+    return False
+
+def offload_response(
+    path: Path,
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None,
+    background: Optional[BackgroundTask] = None
+) -> Optional[Response]:
+    """Empty response telling the front proxy to send path, or None when not offloading.
+
+    The proxy replaces the body and length, and keeps headers such as
+    Content-Type, Content-Disposition and Cache-Control.
+    """
+    if FILE_OFFLOAD_MODE == "x-accel":
+        location = FILE_OFFLOAD_PREFIX.rstrip("/") + "/" + quote(path.relative_to(FILE_OFFLOAD_ROOT).as_posix())
+        offload_header = ("X-Accel-Redirect", location)
+    elif FILE_OFFLOAD_MODE == "x-sendfile":
+        # Header values go out as latin-1; send the path's UTF-8 bytes verbatim
+        offload_header = ("X-Sendfile", os.fsencode(path).decode("latin-1"))
+    else:
+        return None
+
+    headers = dict(headers or {})
+    headers[offload_header[0]] = offload_header[1]
+    return Response(media_type=media_type, headers=headers, background=background)
+
+def file_response(
+    path: Path,
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None,
+    stat_result: Optional[os.stat_result] = None
+) -> Response:
+    """Send a whole file through the proxy when offloading, else via FileResponse,
+    which hands the path to the server (pathsend/sendfile) when supported"""
+    offloaded = offload_response(path, media_type, headers)
+    if offloaded is not None:
+        return offloaded
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+
+def asset_response(
+    request: Request,
+    path: Path,
+    media_type: str,
+    entry: Optional[Dict[str, Any]] = None
+) -> Response:
+    """Serve a report asset with validators, answering 304 when the client copy is current.
+
+    entry is the asset's manifest record; its content hash becomes a strong
+    ETag as long as the file on disk still has the recorded size and mtime.
+    When the entry lists precompressed siblings, the best one the client
+    accepts is sent with Content-Encoding. Without an entry, or when the
+    file has changed since the manifest was built, a weak ETag is derived
+    from the file's stat.
+    """
+    try:
+        stat_result = path.stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Asset not found")
+
+    headers = {}
+    if (entry is not None and entry.get("sha256")
+            and stat_result.st_size == entry["size"] and int(stat_result.st_mtime) == int(entry["mtime"])):
+        etag = f'"{entry["sha256"][:32]}"'
+        mtime = stat_result.st_mtime
+        cache_control = REPORT_ASSET_CACHE_CONTROL
+
+        encodings = entry.get("encodings") or {}
+        if encodings:
+            headers["Vary"] = "Accept-Encoding"
+        encoding = None
+        if FILE_OFFLOAD_MODE == "none":
+            # A proxy picks its own precompressed sibling (gzip_static and
+            # friends use the same .gz/.br names), so it gets the original
+            encoding = negotiate_encoding(request, encodings)
+        if encoding is not None:
+            sibling = path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+            try:
+                sibling_stat = sibling.stat()
+            except FileNotFoundError:
+                sibling_stat = None
+            if sibling_stat is not None and sibling_stat.st_size == encodings[encoding]:
+                # Each representation needs its own strong validator
+                etag = f'"{entry["sha256"][:32]}-{encoding}"'
+                path, stat_result = sibling, sibling_stat
+                headers["Content-Encoding"] = encoding
+    else:
+        etag = f'W/"{int(stat_result.st_mtime):x}-{stat_result.st_size:x}"'
+        mtime = stat_result.st_mtime
+        cache_control = LEGACY_ASSET_CACHE_CONTROL
+
+    headers.update({
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": cache_control,
+    })
+
+    if is_not_modified(request, etag, mtime):
+        return Response(status_code=304, headers=headers)
+
+    return file_response(path, media_type, headers, stat_result)
+
+# Ranges are served as inclusive (start, end) byte offsets
+ByteRange = Tuple[int, int]
+
+# Upper bound on ranges per request, to avoid tiny-range amplification
+MAX_RANGES = int(os.environ.get("MAX_RANGES", "16"))
+RANGE_CHUNK_SIZE = 64 * 1024
+
+class RangeNotSatisfiable(Exception):
+    """The Range header is valid but selects no bytes of the file"""
+
+def parse_range_header(header: str, size: int) -> Optional[List[ByteRange]]:
+    """Parse a bytes Range header (RFC 7233).
+
+    Returns None when the header should be ignored (bad syntax, other units,
+    too many ranges) and raises RangeNotSatisfiable when nothing overlaps.
+    Overlapping or adjacent ranges are coalesced.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_str, sep, end_str = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if start_str == "":
+                # Suffix range: the last N bytes
+                suffix = int(end_str)
+                if suffix <= 0:
+                    continue
+                ranges.append((max(0, size - suffix), size - 1))
+                continue
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        if start > end:
+            return None
+        ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def if_range_matches(request: Request, etag: str, mtime: float) -> bool:
+    """True when there is no If-Range or it still matches the current file"""
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # Only strong validators may be used with If-Range
+        return not etag.startswith("W/") and if_range == etag
+    try:
+        return int(parsedate_to_datetime(if_range).timestamp()) == int(mtime)
+    except (TypeError, ValueError):
+        return False
+
+class FileRangeResponse(Response):
+    """File response supporting single and multipart byte ranges.
+
+    on_complete runs once the response has delivered the final byte of the
+    file without the client disconnecting, so callers can count finished
+    downloads rather than requests (a resumed download completes on the
+    request that fetches the tail).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        size: int,
+        media_type: str,
+        ranges: Optional[List[ByteRange]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        on_complete: Optional[Callable[[], Awaitable[None]]] = None
+    ):
+        self.path = path
+        self.size = size
+        self.ranges = ranges or [(0, size - 1)] if size else []
+        self.on_complete = on_complete
+        self.background = None
+        self.status_code = 206 if ranges else 200
+        self.media_type = media_type
+        self.body = b""
+        self._parts: List[Tuple[bytes, int, int]] = []
+
+        headers = dict(headers or {})
+        headers["Accept-Ranges"] = "bytes"
+        if ranges and len(ranges) > 1:
+            boundary = secrets.token_hex(16)
+            content_type = f"multipart/byteranges; boundary={boundary}"
+            length = 0
+            for start, end in ranges:
+                preamble = (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+                self._parts.append((preamble, start, end))
+                length += len(preamble) + (end - start + 1) + 2
+            self._epilogue = f"--{boundary}--\r\n".encode("latin-1")
+            length += len(self._epilogue)
+        else:
+            content_type = media_type
+            self._epilogue = b""
+            for start, end in self.ranges:
+                self._parts.append((b"", start, end))
+            length = sum(end - start + 1 for start, end in self.ranges)
+            if ranges:
+                start, end = ranges[0]
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        headers["Content-Length"] = str(length)
+        self.init_headers(headers)
+        self.headers["content-type"] = content_type
+        self._multipart = bool(ranges and len(ranges) > 1)
+
+    async def _stream(self, send: Send):
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for preamble, start, end in self._parts:
+                if preamble:
+                    await send({"type": "http.response.body", "body": preamble, "more_body": True})
+                await file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await file.read(min(RANGE_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                if self._multipart:
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        await send({"type": "http.response.body", "body": self._epilogue, "more_body": False})
+        self._delivered = True
+
+    async def _listen_for_disconnect(self, receive: Receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        self._delivered = False
+
+        # Whole-file transfers are handed to the server, which can sendfile
+        # them, unless on_complete needs to know the last byte went out
+        if (self.status_code == 200 and self.on_complete is None
+                and "http.response.pathsend" in scope.get("extensions", {})):
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            return
+
+        async with anyio.create_task_group() as task_group:
+            async def wrap(func):
+                await func()
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(wrap, partial(self._stream, send))
+            await wrap(partial(self._listen_for_disconnect, receive))
+
+        includes_last_byte = any(end == self.size - 1 for _, _, end in self._parts)
+        if self._delivered and includes_last_byte and self.on_complete is not None:
+            await self.on_complete()
+
+def download_response(
+    request: Request,
+    path: Path,
+    media_type: str,
+    sha256: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+    on_complete: Optional[Callable[[], Awaitable[None]]] = None
+) -> Response:
+    """Serve a downloadable file honouring Range and If-Range.
+
+    Transfers with an on_complete callback are streamed from Python even when
+    offloading or pathsend is available: neither the proxy nor the server
+    reports whether the client received the last byte, and the callback must
+    only run for finished transfers.
+    """
+    stat_result = path.stat()
+    size = stat_result.st_size
+    if sha256:
+        etag = f'"{sha256[:32]}"'
+    else:
+        etag = f'W/"{int(stat_result.st_mtime):x}-{size:x}"'
+
+    headers = dict(headers or {})
+    headers["ETag"] = etag
+    headers["Last-Modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+
+    ranges = None
+    range_header = request.headers.get("range")
+    if range_header and if_range_matches(request, etag, stat_result.st_mtime):
+        try:
+            ranges = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=416,
+                headers={"Content-Range": f"bytes */{size}", "Accept-Ranges": "bytes"}
+            )
+
+    if FILE_OFFLOAD_MODE != "none" and on_complete is None:
+        headers["Accept-Ranges"] = "bytes"
+        return offload_response(path, media_type, headers)
+
+    return FileRangeResponse(path, size, media_type, ranges, headers, on_complete)
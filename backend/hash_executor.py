@@ -0,0 +1,131 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+# bcrypt releases the GIL while hashing, so a thread pool sized per core gives
+# real parallelism without the pickling overhead of a process pool.
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+# Maximum number of hash jobs allowed to wait for a free worker
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get("PASSWORD_HASH_QUEUE_LIMIT", PASSWORD_HASH_WORKERS * 8))
+# Seconds clients are told to wait when the hashing queue is full
+PASSWORD_HASH_RETRY_AFTER = int(os.environ.get("PASSWORD_HASH_RETRY_AFTER", "2"))
+
+LATENCY_SAMPLES = 1024
+
+class ExecutorSaturated(Exception):
+    """Raised when the hash queue is full and a job is rejected"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+class HashExecutor:
+    """Bounded thread pool for CPU-heavy password hashing"""
+
+    def __init__(self, workers: int, queue_limit: int, retry_after: int):
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self.retry_after = retry_after
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._running = 0
+        self._running_lock = threading.Lock()
+        self._max_queue_depth = 0
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._wait_ms: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._run_ms: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="password-hash"
+            )
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs accepted but still waiting for a worker"""
+        return self._pending - self._running
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run func(*args) on the pool, rejecting work once the queue is full"""
+        if self._pending >= self.workers + self.queue_limit:
+            self._rejected += 1
+            raise ExecutorSaturated(self.retry_after)
+
+        self._pending += 1
+        self._max_queue_depth = max(self._max_queue_depth, self.queue_depth)
+        submitted = time.perf_counter()
+        started: Dict[str, float] = {}
+
+        def job():
+            started["at"] = time.perf_counter()
+            with self._running_lock:
+                self._running += 1
+            try:
+                return func(*args)
+            finally:
+                with self._running_lock:
+                    self._running -= 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._get_executor(), job)
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._pending -= 1
+            finished = time.perf_counter()
+            if "at" in started:
+                self._wait_ms.append((started["at"] - submitted) * 1000)
+                self._run_ms.append((finished - started["at"]) * 1000)
+
+        self._completed += 1
+        return result
+
+    def shutdown(self):
+        """Stop the worker threads, waiting for in-flight hashes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth and latency metrics"""
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "queue_depth": self.queue_depth,
+            "running": self._running,
+            "max_queue_depth": self._max_queue_depth,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "failed": self._failed,
+            "wait_ms": _summarize(self._wait_ms),
+            "run_ms": _summarize(self._run_ms),
+        }
+
+def _summarize(samples: Deque[float]) -> Dict[str, float]:
+    """Average and percentiles over the most recent latency samples"""
+    if not samples:
+        return {"avg": 0.0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        "avg": round(sum(ordered) / len(ordered), 2),
+        "p50": round(ordered[int(last * 0.50)], 2),
+        "p99": round(ordered[int(last * 0.99)], 2),
+        "max": round(ordered[last], 2),
+    }
+
+# Shared executor used by auth for every bcrypt hash and verify
+password_executor = HashExecutor(
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT, PASSWORD_HASH_RETRY_AFTER
+)
@@ -0,0 +1,374 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from models import IngestionJob, JobStage, JobStatus, Report, ReportStatus, ActivityType
+from uploads import extract_archive_async, build_report_manifest, precompress_manifest_async, ArchiveRejected
+from utils import log_activity
+from email_service import get_new_report_email_html, PORTAL_URL
+from email_outbox import outbox_worker, new_outbox_message
+from report_cache import report_cache
+from counters import dashboard_counters, PUBLISHED_REPORTS
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = Path("/app/uploads")
+
+# Number of jobs processed concurrently by this process
+INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", "2"))
+# How long a claimed job is owned before another process may resume it
+INGESTION_JOB_LEASE = int(os.environ.get("INGESTION_JOB_LEASE", "900"))
+# How often to look for queued jobs and jobs whose owner's lease has lapsed
+INGESTION_SWEEP_INTERVAL = float(os.environ.get("INGESTION_SWEEP_INTERVAL", "60"))
+
+class IngestionWorker:
+    """Processes report ingestion jobs persisted in db.ingestion_jobs"""
+
+    def __init__(self, concurrency: int, lease_seconds: int, sweep_interval: float):
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.sweep_interval = sweep_interval
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        # Fire-and-forget progress writes, referenced until they finish
+        self._background: Set[asyncio.Task] = set()
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self, db: AsyncIOMotorDatabase):
+        """Start the worker tasks and the sweep that re-queues jobs left over
+        from a restart or abandoned by a process that died"""
+        self._db = db
+        self._queue = asyncio.Queue()
+        self._queued = set()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self):
+        """Stop the workers; unfinished jobs are resumed on next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, db: AsyncIOMotorDatabase, job: IngestionJob):
+        """Persist a new job and schedule it"""
+        await db.ingestion_jobs.insert_one(job.dict())
+        if self._queue is not None:
+            self._enqueue(job.id)
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _resume(self) -> int:
+        """Queue jobs that are waiting or whose owner's lease has lapsed.
+
+        A job still RUNNING under a live lease (its owner may be alive, or
+        may have crashed moments ago) is left alone and picked up by a later
+        sweep once the lease runs out.
+        """
+        now = datetime.utcnow()
+        cursor = self._db.ingestion_jobs.find(
+            {"$or": [
+                {"status": JobStatus.QUEUED},
+                {"status": JobStatus.RUNNING, "lease_until": {"$lt": now}},
+            ]},
+            {"id": 1}
+        ).sort("created_at", 1)
+        resumed = 0
+        async for job in cursor:
+            if job["id"] not in self._queued:
+                self._enqueue(job["id"])
+                resumed += 1
+        if resumed:
+            logger.info(f"Resuming {resumed} ingestion job(s)")
+        return resumed
+
+    async def _sweep(self):
+        while True:
+            try:
+                await self._resume()
+            except Exception as e:
+                logger.error(f"Ingestion job sweep failed: {str(e)}")
+            await asyncio.sleep(self.sweep_interval)
+
+    async def _run(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                job = await self._claim(job_id)
+            except Exception as e:
+                # Left for the next sweep to retry
+                logger.error(f"Could not claim ingestion job {job_id}: {str(e)}")
+                continue
+            if job is None:
+                continue
+            self.active += 1
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} was interrupted: {str(e)}")
+            finally:
+                self.active -= 1
+
+    async def _renew_lease(self, job_id: str):
+        """Keep extending the lease while a job is processed, so a long
+        extraction is not taken over by another process"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self._db.ingestion_jobs.update_one(
+                    {"id": job_id, "status": JobStatus.RUNNING},
+                    {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+                )
+            except Exception as e:
+                logger.warning(f"Could not renew lease of ingestion job {job_id}: {str(e)}")
+
+    async def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically take ownership of a job, so only one process runs it"""
+        now = datetime.utcnow()
+        return await self._db.ingestion_jobs.find_one_and_update(
+            {
+                "id": job_id,
+                "$or": [
+                    {"status": JobStatus.QUEUED},
+                    {"status": JobStatus.RUNNING, "lease_until": {"$lt": now}},
+                ]
+            },
+            {
+                "$set": {
+                    "status": JobStatus.RUNNING,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _update(self, job_id: str, fields: Dict[str, Any]):
+        fields["updated_at"] = datetime.utcnow()
+        await self._db.ingestion_jobs.update_one({"id": job_id}, {"$set": fields})
+
+    async def _process(self, job: Dict[str, Any]):
+        """Run the remaining stages of a job, recording progress and errors"""
+        stages = [
+            (JobStage.EXTRACTING, self._extract),
+            (JobStage.REGISTERING, self._register),
+            (JobStage.NOTIFYING, self._notify),
+            (JobStage.COMPRESSING, self._compress),
+        ]
+        stage_names = [stage for stage, _ in stages]
+        start = stage_names.index(job["stage"]) if job["stage"] in stage_names else 0
+
+        renewer = asyncio.create_task(self._renew_lease(job["id"]))
+        try:
+            for stage, handler in stages[start:]:
+                await self._update(job["id"], {
+                    "stage": stage,
+                    "lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+                })
+                job["stage"] = stage
+                result = await handler(job)
+                job["result"].update(result)
+                await self._update(job["id"], {"result": job["result"]})
+        except Exception as e:
+            logger.error(f"Ingestion job {job['id']} failed at {job['stage']}: {str(e)}")
+            await self._update(job["id"], {"status": JobStatus.FAILED, "error": str(e)})
+            self.failed += 1
+            return
+        finally:
+            renewer.cancel()
+
+        await self._update(job["id"], {"status": JobStatus.COMPLETED, "stage": JobStage.COMPLETED})
+        self.completed += 1
+
+    async def _extract(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract uploaded archives and choose the report's main file"""
+        files = []
+        main_file = None
+
+        # Members in the archives already extracted, so progress covers the
+        # whole job rather than restarting at each archive
+        extracted_before = {"offset": 0, "current": 0}
+
+        def on_progress(done: int, total: int):
+            extracted_before["current"] = total
+            offset = extracted_before["offset"]
+            # Progress updates may land out of order; $max keeps them monotonic
+            task = asyncio.create_task(self._db.ingestion_jobs.update_one(
+                {"id": job["id"]},
+                {"$max": {"progress.done": offset + done, "progress.total": offset + total}}
+            ))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+        for uploaded in job["files"]:
+            file_path = UPLOAD_DIR / uploaded["path"]
+            uploaded_entry = {
+                "path": uploaded["path"],
+                "size": uploaded["size"],
+                "mtime": file_path.stat().st_mtime,
+                "sha256": uploaded["sha256"],
+            }
+            if not uploaded["is_archive"]:
+                files.append(uploaded_entry)
+                # Set main file if it's HTML
+                if file_path.suffix.lower() == '.html' and not main_file:
+                    main_file = uploaded["path"]
+                continue
+
+            try:
+                extracted_files = await extract_archive_async(file_path, file_path.parent, on_progress)
+                extracted_before["offset"] += extracted_before["current"]
+                extracted_before["current"] = 0
+            except ArchiveRejected:
+                # The job cannot succeed; do not leave its uploads on disk
+                for rejected in job["files"]:
+                    (UPLOAD_DIR / rejected["path"]).unlink(missing_ok=True)
+                raise
+            except Exception as e:
+                # If extraction fails, keep the ZIP as is
+                logger.warning(f"Could not extract {uploaded['path']}: {str(e)}")
+                files.append(uploaded_entry)
+                continue
+
+            for extracted in extracted_files:
+                extracted_file = extracted["path"]
+                relative_path = str(extracted_file.relative_to(UPLOAD_DIR))
+                files.append({**extracted, "path": relative_path})
+
+                # Set main file if it's Main.html or index.html (preferred names)
+                if extracted_file.suffix.lower() == '.html' and not main_file:
+                    if extracted_file.name.lower() in ['main.html', 'index.html']:
+                        main_file = relative_path
+
+            # If no Main.html or index.html found, pick first HTML file
+            if not main_file:
+                for f in files:
+                    if f["path"].lower().endswith('.html'):
+                        main_file = f["path"]
+                        break
+
+        if not main_file:
+            main_file = files[0]["path"] if files else ""
+
+        return {
+            "main_file": main_file,
+            "files": files,
+            "files_uploaded": len(files),
+        }
+
+    async def _register(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Create the report record; safe to repeat after a restart"""
+        main_file = job["result"]["main_file"]
+        files = job["result"]["files"]
+        uploaded_files = [f["path"] for f in files]
+        report = Report(
+            id=job["report_id"],
+            title=job["title"],
+            description=job["description"],
+            company_id=job["company_id"],
+            main_file=main_file,
+            supporting_files=[f for f in uploaded_files if f != main_file],
+            file_size=sum(f["size"] for f in job["files"]),
+            checksums={f["path"]: f["sha256"] for f in job["files"]},
+            allow_download=job["allow_download"],
+            uploaded_by=job["uploaded_by"],
+            status=ReportStatus.PUBLISHED
+        )
+        report_doc = report.dict()
+        # Stored on the document but not part of the API model
+        report_doc["manifest"] = build_report_manifest(main_file, files)
+
+        result = await self._db.reports.update_one(
+            {"id": report.id},
+            {"$setOnInsert": report_doc},
+            upsert=True
+        )
+        if result.upserted_id is not None:
+            await dashboard_counters.increment(self._db, PUBLISHED_REPORTS)
+            company = await self._db.companies.find_one({"id": job["company_id"]})
+            company_name = company["name"] if company else job["company_id"]
+            await log_activity(
+                self._db, job["uploaded_by"], job["uploaded_by_email"], ActivityType.REPORT_UPLOAD,
+                f"Uploaded report '{job['title']}' for {company_name}",
+                job["ip_address"],
+                metadata={"report_id": report.id, "file_count": len(uploaded_files), "job_id": job["id"]},
+                company_id=job["company_id"]
+            )
+
+        return {}
+
+    async def _notify(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue new-report emails for all company users if requested"""
+        notifications_queued = 0
+        if not job["notify_users"]:
+            return {"notifications_queued": notifications_queued}
+
+        company = await self._db.companies.find_one({"id": job["company_id"]})
+        if not company:
+            return {"notifications_queued": notifications_queued}
+
+        company_users = await self._db.users.find({"company_id": job["company_id"]}, {"email": 1, "full_name": 1}).limit(500).to_list(length=500)
+        # Deterministic ids keep a resumed job from queueing duplicates
+        messages = [new_outbox_message(
+            recipient_email=user["email"],
+            subject=f"Nuevo Reporte Disponible: {job['title']}",
+            html_content=get_new_report_email_html(
+                user_name=user.get("full_name", "Usuario"),
+                report_title=job["title"],
+                company_name=company["name"],
+                portal_url=PORTAL_URL
+            ),
+            kind="new_report",
+            message_id=f"{job['id']}:{user['email']}",
+            metadata={"report_id": job["report_id"], "job_id": job["id"]}
+        ) for user in company_users]
+        await outbox_worker.enqueue(self._db, messages)
+        notifications_queued = len(messages)
+
+        return {"notifications_queued": notifications_queued}
+
+    async def _compress(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Write .gz/.br siblings for text assets once the report is already live"""
+        report = await self._db.reports.find_one({"id": job["report_id"]}, {"main_file": 1, "manifest": 1})
+        if not report or not report.get("manifest"):
+            return {"files_compressed": 0}
+
+        report_dir = UPLOAD_DIR / Path(report["main_file"]).parent
+        try:
+            manifest, compressed = await precompress_manifest_async(report_dir, report["manifest"])
+        except Exception as e:
+            # Only an optimization: the report is already published and served uncompressed
+            logger.warning(f"Could not precompress report {job['report_id']}: {str(e)}")
+            return {"files_compressed": 0}
+        await self._db.reports.update_one({"id": job["report_id"]}, {"$set": {"manifest": manifest}})
+        report_cache.invalidate(job["report_id"])
+
+        return {"files_compressed": compressed}
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue and outcome counters for monitoring"""
+        return {
+            "workers": self.concurrency,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "active": self.active,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+# Shared worker started by the server lifespan
+ingestion_worker = IngestionWorker(INGESTION_WORKERS, INGESTION_JOB_LEASE, INGESTION_SWEEP_INTERVAL)
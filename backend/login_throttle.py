@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from models import ActivityType
+from utils import log_activity
+
+logger = logging.getLogger(__name__)
+
+# "memory" counts failures in this process; "mongo" shares counts between workers
+LOGIN_THROTTLE_STORE = os.environ.get("LOGIN_THROTTLE_STORE", "memory").lower()
+# Sliding window over which failed logins are counted, in seconds
+LOGIN_THROTTLE_WINDOW = int(os.environ.get("LOGIN_THROTTLE_WINDOW", "300"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get("LOGIN_MAX_FAILURES_PER_IP", "20"))
+# Counted per (email, IP), so failures from elsewhere cannot lock the owner out
+LOGIN_MAX_FAILURES_PER_EMAIL = int(os.environ.get("LOGIN_MAX_FAILURES_PER_EMAIL", "5"))
+# Counted per account across all IPs, capping guesses spread over many addresses
+LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.environ.get("LOGIN_MAX_FAILURES_PER_ACCOUNT", "50"))
+LOGIN_THROTTLE_MAX_KEYS = int(os.environ.get("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+# Distinct (email, IP) pairs summarized before an early flush
+FAILED_LOGIN_SUMMARY_MAX_KEYS = int(os.environ.get("FAILED_LOGIN_SUMMARY_MAX_KEYS", "10000"))
+# Unknown emails kept as a sample on each per-IP probe summary
+FAILED_LOGIN_EMAIL_SAMPLES = int(os.environ.get("FAILED_LOGIN_EMAIL_SAMPLES", "10"))
+# Failure reason for emails with no account; summarized per IP, not per email
+UNKNOWN_ACCOUNT = "user not found"
+
+def throttle_keys(ip_address: Optional[str], email: str) -> List[Tuple[str, int]]:
+    """Counter keys an attempt is charged to, with the limit of each: the
+    account as tried from this IP, the account from anywhere, and the IP
+    across all accounts"""
+    account = f"email:{email.strip().lower()}"
+    if not ip_address:
+        return [(account, LOGIN_MAX_FAILURES_PER_ACCOUNT)]
+    return [
+        (f"{account}|ip:{ip_address}", LOGIN_MAX_FAILURES_PER_EMAIL),
+        (account, LOGIN_MAX_FAILURES_PER_ACCOUNT),
+        (f"ip:{ip_address}", LOGIN_MAX_FAILURES_PER_IP),
+    ]
+
+def account_keys(ip_address: Optional[str], email: str) -> List[str]:
+    """Keys a successful login clears: the account's, not the IP's"""
+    return [key for key, _ in throttle_keys(ip_address, email) if key.startswith("email:")]
+
+def sliding_count(previous: int, current: int, elapsed: float, window: int) -> float:
+    """Failures in the last window seconds, assuming the previous fixed
+    window's failures were spread evenly across it"""
+    return previous * (1 - elapsed / window) + current
+
+class MemoryLoginThrottle:
+    """Process-local sliding-window failure counters, two integers per key"""
+
+    def __init__(self, window: int, max_keys: int):
+        self.window = max(1, window)
+        self.max_keys = max(1, max_keys)
+        # key -> [window index, previous window count, current window count]
+        self._counters: "OrderedDict[str, List[int]]" = OrderedDict()
+        self.rejected = 0
+        self.evicted = 0
+
+    def _counts(self, key: str, index: int) -> Tuple[int, int]:
+        counter = self._counters.get(key)
+        if counter is None or counter[0] < index - 1:
+            return 0, 0
+        if counter[0] == index - 1:
+            return counter[2], 0
+        return counter[1], counter[2]
+
+    async def retry_after(self, ip_address: Optional[str], email: str) -> Optional[int]:
+        """Seconds to wait if the IP or the account, overall or from this
+        IP, is over its limit, else None"""
+        now = time.time()
+        index, elapsed = divmod(now, self.window)
+        for key, limit in throttle_keys(ip_address, email):
+            previous, current = self._counts(key, int(index))
+            if sliding_count(previous, current, elapsed, self.window) >= limit:
+                self.rejected += 1
+                return max(1, math.ceil(self.window - elapsed))
+        return None
+
+    async def record_failure(self, ip_address: Optional[str], email: str):
+        index = int(time.time() // self.window)
+        for key, _ in throttle_keys(ip_address, email):
+            previous, current = self._counts(key, index)
+            self._counters[key] = [index, previous, current + 1]
+            self._counters.move_to_end(key)
+        while len(self._counters) > self.max_keys:
+            self._counters.popitem(last=False)
+            self.evicted += 1
+
+    async def reset(self, ip_address: Optional[str], email: str):
+        """Clear an account's failures after it logs in successfully"""
+        for key in account_keys(ip_address, email):
+            self._counters.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "keys": len(self._counters),
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
+
+class MongoLoginThrottle:
+    """Failure counters shared across workers, one document per key and
+    fixed window; a TTL index removes windows that can no longer count"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, window: int):
+        self._db = db
+        self.window = max(1, window)
+        self.rejected = 0
+
+    async def retry_after(self, ip_address: Optional[str], email: str) -> Optional[int]:
+        now = time.time()
+        index, elapsed = divmod(now, self.window)
+        index = int(index)
+        limits = dict(throttle_keys(ip_address, email))
+        counts = {key: [0, 0] for key in limits}
+        async for doc in self._db.login_failures.find(
+            {"key": {"$in": list(limits)}, "window": {"$in": [index - 1, index]}}
+        ):
+            counts[doc["key"]][doc["window"] - index + 1] = doc["count"]
+        for key, limit in limits.items():
+            previous, current = counts[key]
+            if sliding_count(previous, current, elapsed, self.window) >= limit:
+                self.rejected += 1
+                return max(1, math.ceil(self.window - elapsed))
+        return None
+
+    async def record_failure(self, ip_address: Optional[str], email: str):
+        index = int(time.time() // self.window)
+        expires_at = datetime.utcnow() + timedelta(seconds=2 * self.window)
+        await self._db.login_failures.bulk_write([
+            UpdateOne(
+                {"key": key, "window": index},
+                {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": expires_at}},
+                upsert=True
+            )
+            for key, _ in throttle_keys(ip_address, email)
+        ], ordered=False)
+
+    async def reset(self, ip_address: Optional[str], email: str):
+        await self._db.login_failures.delete_many({"key": {"$in": account_keys(ip_address, email)}})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "mongo", "rejected": self.rejected}
+
+class FailedLoginLog:
+    """Coalesces failed and throttled logins into one FAILED_LOGIN entry per
+    (email, IP) per throttle window instead of one entry per attempt.
+
+    Attempts for accounts that do not exist ("user not found") are folded
+    into a single entry per IP with a sample of the emails tried, so probing
+    many addresses costs no more log writes than probing one. Any other
+    reason, including "throttled", stays with its email.
+    """
+
+    def __init__(self, interval: float, max_keys: int):
+        self.interval = interval
+        self.max_keys = max(1, max_keys)
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._entries: Dict[Tuple[Optional[str], Optional[str]], Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.attempts = 0
+        self.summaries = 0
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write the summaries still open"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    async def record(
+        self,
+        db: AsyncIOMotorDatabase,
+        email: str,
+        ip_address: Optional[str],
+        reason: str,
+        user: Optional[Dict[str, Any]] = None
+    ):
+        """Count a failed attempt; written immediately when not running"""
+        self.attempts += 1
+        now = datetime.utcnow()
+        if reason == UNKNOWN_ACCOUNT:
+            key = (None, ip_address)
+        else:
+            key = (email.strip().lower(), ip_address)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = {
+                "email": email if key[0] is not None else None,
+                "ip_address": ip_address,
+                "user_id": user["id"] if user else None,
+                "company_id": user.get("company_id") if user else None,
+                "sample_emails": set(),
+                "reasons": Counter(),
+                "first_attempt": now,
+            }
+        elif user and entry["user_id"] is None:
+            # A throttled attempt opened the entry before the account was looked up
+            entry["user_id"] = user["id"]
+            entry["company_id"] = user.get("company_id")
+        if entry["email"] is None and len(entry["sample_emails"]) < FAILED_LOGIN_EMAIL_SAMPLES:
+            entry["sample_emails"].add(email)
+        entry["reasons"][reason] += 1
+        entry["last_attempt"] = now
+
+        if self._task is None:
+            self._db = db
+            await self.flush()
+        elif len(self._entries) >= self.max_keys:
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write one summary entry per (email, IP), or per IP for unknown
+        accounts, seen since the last flush"""
+        if not self._entries or self._db is None:
+            return 0
+        entries, self._entries = self._entries, {}
+        for entry in entries.values():
+            attempts = sum(entry["reasons"].values())
+            reasons = ", ".join(f"{reason} x{count}" for reason, count in entry["reasons"].most_common())
+            metadata = {
+                "attempts": attempts,
+                "reasons": dict(entry["reasons"]),
+                "first_attempt": entry["first_attempt"],
+                "last_attempt": entry["last_attempt"],
+            }
+            if entry["email"] is not None:
+                description = f"{attempts} failed login attempt(s) for {entry['email']} ({reasons})"
+            else:
+                description = f"{attempts} failed login attempt(s) for unknown accounts from {entry['ip_address']} ({reasons})"
+                metadata["sample_emails"] = sorted(entry["sample_emails"])
+            await log_activity(
+                self._db, entry["user_id"], entry["email"], ActivityType.FAILED_LOGIN,
+                description, entry["ip_address"],
+                metadata=metadata,
+                company_id=entry["company_id"]
+            )
+        self.summaries += len(entries)
+        return len(entries)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to write failed-login summaries: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open_summaries": len(self._entries),
+            "attempts": self.attempts,
+            "summaries": self.summaries,
+        }
+
+login_throttle = MemoryLoginThrottle(LOGIN_THROTTLE_WINDOW, LOGIN_THROTTLE_MAX_KEYS)
+failed_login_log = FailedLoginLog(LOGIN_THROTTLE_WINDOW, FAILED_LOGIN_SUMMARY_MAX_KEYS)
+
+def configure_login_throttle(db: AsyncIOMotorDatabase):
+    """Select the configured throttle backend and start the failure summaries"""
+    global login_throttle
+    if LOGIN_THROTTLE_STORE == "mongo":
+        login_throttle = MongoLoginThrottle(db, LOGIN_THROTTLE_WINDOW)
+    failed_login_log.start(db)
+    logger.info(f"Login throttle store: {LOGIN_THROTTLE_STORE}")
+
+def get_login_throttle():
+    """Get the active login throttle"""
+    return login_throttle
@@ -0,0 +1,37 @@
+"""
+Rebuild the hourly and daily activity rollups from activity_logs.
+
+New activity is rolled up as it is written; run this once after deploying
+the rollups, or again to repair a window. Run from the backend directory:
+    python -m migrations.backfill_activity_rollups [--since YYYY-MM-DD] [--until YYYY-MM-DD]
+
+Buckets inside the window are replaced, so re-running is safe. Keep the
+window on day boundaries and end it before live rollups began (or at the
+current hour) to avoid overwriting counts that are still accumulating.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+
+import database
+from rollups import activity_rollups
+
+logger = logging.getLogger(__name__)
+
+async def backfill(since: datetime = None, until: datetime = None):
+    await database.connect_to_mongo()
+    try:
+        await database.create_indexes()
+        await activity_rollups.backfill(database.database, since, until)
+        logger.info("Activity rollups rebuilt")
+    finally:
+        await database.close_mongo_connection()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat)
+    args = parser.parse_args()
+    asyncio.run(backfill(args.since, args.until))
@@ -0,0 +1,117 @@
+"""
+Rename uploaded report files to NFC and rewrite the paths stored on reports.
+
+Archives built on macOS carry NFD (decomposed) names. Ingestion now stores
+every path in NFC, and this migration brings older uploads in line so asset
+lookups need a single exact key. Run it from the backend directory while
+deploying, before the new server version starts:
+    python -m migrations.normalize_upload_paths [--dry-run]
+
+It is safe to interrupt and re-run: renames skip names that are already NFC,
+and each report is marked once its document has been rewritten.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List
+
+import database
+from uploads import build_report_manifest
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = Path("/app/uploads")
+
+def nfc(path: str) -> str:
+    return unicodedata.normalize('NFC', path)
+
+def rename_tree(root: Path, dry_run: bool = False) -> Dict[str, int]:
+    """Rename every file and directory under root to its NFC name, deepest first"""
+    counts = {"renamed": 0, "conflicts": 0}
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        for name in filenames + dirnames:
+            target_name = nfc(name)
+            if target_name == name:
+                continue
+            source = Path(dirpath) / name
+            target = Path(dirpath) / target_name
+            if target.exists():
+                # Both spellings exist; keep them apart rather than overwrite
+                logger.warning(f"Not renaming {source}: {target} already exists")
+                counts["conflicts"] += 1
+                continue
+            if not dry_run:
+                source.rename(target)
+            counts["renamed"] += 1
+    return counts
+
+def canonical_path(path: str) -> str:
+    """The NFC spelling of a stored path if that is what exists on disk"""
+    normalized = nfc(path)
+    if normalized == path or not (UPLOAD_DIR / normalized).exists():
+        return path
+    return normalized
+
+def file_entry(path: str) -> Dict[str, Any]:
+    """Size, mtime and hash for a report file that predates the manifest"""
+    full_path = UPLOAD_DIR / path
+    digest = hashlib.sha256()
+    with open(full_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    stat_result = full_path.stat()
+    return {"path": path, "size": stat_result.st_size, "mtime": stat_result.st_mtime,
+            "sha256": digest.hexdigest()}
+
+def rewrite_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields to $set on a report so its paths and manifest use NFC"""
+    main_file = canonical_path(report["main_file"])
+    supporting_files = [canonical_path(p) for p in report.get("supporting_files", [])]
+    checksums = {canonical_path(p): h for p, h in report.get("checksums", {}).items()}
+
+    if report.get("manifest"):
+        report_dir = Path(main_file).parent
+        manifest = build_report_manifest(main_file, [
+            {**entry, "path": canonical_path(str(report_dir / entry["path"]))}
+            for entry in report["manifest"]
+        ])
+    else:
+        files: List[Dict[str, Any]] = []
+        for path in [main_file] + supporting_files:
+            if (UPLOAD_DIR / path).is_file():
+                files.append(file_entry(path))
+        manifest = build_report_manifest(main_file, files)
+
+    return {
+        "main_file": main_file,
+        "supporting_files": supporting_files,
+        "checksums": checksums,
+        "manifest": manifest,
+        "paths_normalized": True,
+    }
+
+async def migrate(dry_run: bool = False):
+    await database.connect_to_mongo()
+    db = database.database
+    try:
+        counts = rename_tree(UPLOAD_DIR, dry_run)
+        logger.info(f"Renamed {counts['renamed']} path(s), {counts['conflicts']} conflict(s)")
+
+        updated = 0
+        cursor = db.reports.find({"paths_normalized": {"$ne": True}})
+        async for report in cursor:
+            fields = rewrite_report(report)
+            if not dry_run:
+                await db.reports.update_one({"id": report["id"]}, {"$set": fields})
+            updated += 1
+        logger.info(f"Rewrote paths on {updated} report(s)")
+    finally:
+        await database.close_mongo_connection()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(migrate(dry_run="--dry-run" in sys.argv[1:]))
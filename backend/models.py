@@ -19,12 +19,27 @@ class ActivityType(str, Enum):
     REPORT_VIEW = "report_view"
     REPORT_DOWNLOAD = "report_download"
     REPORT_UPLOAD = "report_upload"
+    REPORT_DELETE = "report_delete"
     USER_CREATE = "user_create"
     USER_DELETE = "user_delete"
     COMPANY_CREATE = "company_create"
     COMPANY_DELETE = "company_delete"
     FAILED_LOGIN = "failed_login"
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class JobStage(str, Enum):
+    QUEUED = "queued"
+    EXTRACTING = "extracting"
+    REGISTERING = "registering"
+    NOTIFYING = "notifying"
+    COMPRESSING = "compressing"
+    COMPLETED = "completed"
+
 # Company Models
 class CompanyBase(BaseModel):
     name: str
@@ -111,6 +126,7 @@ class Report(ReportBase):
     main_file: str
     supporting_files: List[str] = []
     file_size: int = 0
+    checksums: Dict[str, str] = {}  # Uploaded file path -> SHA-256
     download_count: int = 0
     view_count: int = 0
     allow_download: bool = False  # Default: view only, no download
@@ -122,6 +138,7 @@ class Report(ReportBase):
 class ActivityLogBase(BaseModel):
     user_id: Optional[str] = None
     user_email: Optional[str] = None
+    company_id: Optional[str] = None
     activity_type: ActivityType
     description: str
     ip_address: Optional[str] = None
@@ -135,6 +152,35 @@ class ActivityLog(ActivityLogBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+# Ingestion Job Models
+class IngestionFile(BaseModel):
+    path: str  # Relative to the uploads directory
+    size: int
+    sha256: str
+    is_archive: bool = False
+
+class IngestionJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    report_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    status: JobStatus = JobStatus.QUEUED
+    stage: JobStage = JobStage.QUEUED
+    progress: Dict[str, int] = {"done": 0, "total": 0}
+    error: Optional[str] = None
+    title: str
+    description: Optional[str] = None
+    company_id: str
+    allow_download: bool = False
+    notify_users: bool = False
+    uploaded_by: str  # User ID
+    uploaded_by_email: Optional[str] = None
+    ip_address: Optional[str] = None
+    files: List[IngestionFile] = []
+    result: Dict[str, Any] = {}
+    attempts: int = 0
+    lease_until: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 # Statistics Models
 class DashboardStats(BaseModel):
     total_companies: int
@@ -143,6 +189,30 @@ class DashboardStats(BaseModel):
     total_access_logs: int
     recent_activities: List[ActivityLog]
 
+class TrendPoint(BaseModel):
+    bucket: datetime
+    activity_type: str
+    count: int
+    company_id: Optional[str] = None
+    report_id: Optional[str] = None
+    ip_address: Optional[str] = None
+
+# Password-sharing flags
+class SharingEvidence(BaseModel):
+    ip_addresses: List[str] = []
+    user_agents: List[str] = []
+    concurrent_view_tokens: int = 0
+    ip_switches: List[Dict[str, Any]] = []
+
+class SharingFlag(BaseModel):
+    id: str  # The flagged user's id
+    user_email: Optional[str] = None
+    reasons: List[str]
+    evidence: SharingEvidence
+    hits: int = 1
+    first_flagged_at: datetime
+    last_flagged_at: datetime
+
 # File Upload Models
 class FileUploadResponse(BaseModel):
     filename: str
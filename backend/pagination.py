@@ -0,0 +1,121 @@
+import base64
+import json
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple, Type
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pydantic import BaseModel
+
+# Response header carrying the cursor for the next page; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(doc: Dict[str, Any], sort_field: str = "created_at") -> str:
+    """Opaque cursor pointing just past doc in (sort_field, id) descending order"""
+    raw = json.dumps({"c": doc[sort_field].isoformat(), "i": doc["id"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["c"]), str(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def prefix_filter(prefix: str) -> Dict[str, str]:
+    """Anchored, case-sensitive match that can use an index on the field"""
+    return {"$regex": "^" + re.escape(prefix)}
+
+def fields_projection(
+    fields: Optional[str],
+    model: Type[BaseModel],
+    sort_field: str = "created_at"
+) -> Optional[Dict[str, int]]:
+    """Mongo projection for a comma-separated fields= parameter.
+
+    id and the sort field are always included because the cursor is built from them.
+    """
+    if not fields:
+        return None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    allowed: Set[str] = set(model.model_fields)
+    unknown = requested - allowed
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    projection = {f: 1 for f in requested | {"id", sort_field}}
+    projection["_id"] = 0
+    return projection
+
+def keyset_query(query: Dict[str, Any], cursor: Optional[str], sort_field: str = "created_at") -> Dict[str, Any]:
+    """Add the "after cursor" condition to a filter.
+
+    Written as sort_field <= v AND (sort_field < v OR id < last_id): the
+    bound is applied to the index scan and the $or only filters the rows at
+    the boundary, so the planner has no reason to split the query into an
+    $or plan that needs an in-memory sort.
+    """
+    if not cursor:
+        return query
+    sort_value, last_id = decode_cursor(cursor)
+    bounds = dict(query.get(sort_field) or {})
+    bounds["$lte"] = min(bounds["$lte"], sort_value) if "$lte" in bounds else sort_value
+    return {
+        **query,
+        sort_field: bounds,
+        "$or": [
+            {sort_field: {"$lt": sort_value}},
+            {"id": {"$lt": last_id}},
+        ]
+    }
+
+def keyset_sort(sort_field: str = "created_at") -> List[Tuple[str, int]]:
+    return [(sort_field, -1), ("id", -1)]
+
+async def fetch_page(
+    collection: AsyncIOMotorCollection,
+    query: Dict[str, Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    sort_field: str = "created_at"
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of documents, newest first, and the cursor for the next page"""
+    docs = await collection.find(keyset_query(query, cursor, sort_field), projection).sort(
+        keyset_sort(sort_field)
+    ).limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_field)
+    return docs, next_cursor
+
+def page_response(
+    docs: List[Dict[str, Any]],
+    next_cursor: Optional[str],
+    model: Type[BaseModel],
+    partial: bool = False
+) -> JSONResponse:
+    """Serialize a page as a JSON list, with the next cursor in a header.
+
+    Full documents go through the model; partial ones (fields=) are returned
+    as projected, since they would not validate against it.
+    """
+    if partial:
+        for doc in docs:
+            doc.pop("_id", None)
+        content = docs
+    else:
+        content = [model(**doc) for doc in docs]
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return JSONResponse(jsonable_encoder(content), headers=headers)
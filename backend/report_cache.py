@@ -0,0 +1,64 @@
+import os
+import unicodedata
+from typing import Any, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from cache import TTLCache
+from models import ReportStatus
+
+# Number of published reports kept in memory, and how long each is trusted.
+# Other processes invalidate only their own copy, so the TTL bounds how long
+# a status change made elsewhere can go unnoticed.
+REPORT_CACHE_SIZE = int(os.environ.get("REPORT_CACHE_SIZE", "256"))
+REPORT_CACHE_TTL = float(os.environ.get("REPORT_CACHE_TTL", "60"))
+
+def manifest_key(path: str) -> str:
+    """Lookup key for an asset path relative to the report directory"""
+    return unicodedata.normalize('NFC', path)
+
+class ReportCache:
+    """Metadata needed to serve a published report, cached per report id.
+
+    Each entry holds the report's main file, company, download flag and a
+    dict of its manifest entries keyed by NFC path, so serving an asset
+    needs no database query while the entry is fresh.
+    """
+
+    def __init__(self, max_reports: int, ttl: float):
+        self._cache = TTLCache(max_reports, ttl)
+
+    async def get(self, db: AsyncIOMotorDatabase, report_id: str) -> Optional[Dict[str, Any]]:
+        """Cached metadata for a published report, or None if there is none"""
+        report = self._cache.get(report_id)
+        if report is not None:
+            return report
+
+        doc = await db.reports.find_one(
+            {"id": report_id, "status": ReportStatus.PUBLISHED},
+            {"id": 1, "title": 1, "company_id": 1, "main_file": 1, "allow_download": 1, "manifest": 1}
+        )
+        if doc is None:
+            return None
+        report = {
+            "id": doc["id"],
+            "title": doc["title"],
+            "company_id": doc["company_id"],
+            "main_file": doc["main_file"],
+            "allow_download": doc.get("allow_download", False),
+            "assets": {manifest_key(entry["key"]): entry for entry in doc.get("manifest") or []},
+        }
+        self._cache.set(report_id, report)
+        return report
+
+    def invalidate(self, report_id: str):
+        """Drop a report after its status or files change, or it is deleted"""
+        self._cache.pop(report_id)
+
+    def invalidate_company(self, company_id: str):
+        self._cache.evict_where(lambda report: report["company_id"] == company_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+report_cache = ReportCache(REPORT_CACHE_SIZE, REPORT_CACHE_TTL)
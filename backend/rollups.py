@@ -0,0 +1,151 @@
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+HOUR = "hour"
+DAY = "day"
+GRANULARITIES = (HOUR, DAY)
+
+# Unique keys of the two rollup collections
+REPORT_ROLLUP_KEY = ("granularity", "bucket", "company_id", "report_id", "activity_type")
+IP_ROLLUP_KEY = ("granularity", "bucket", "ip_address", "activity_type")
+# Rollup documents written per bulk_write during a backfill
+BACKFILL_BATCH_SIZE = 1000
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Start of the hour or day containing timestamp"""
+    if granularity == HOUR:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def activity_weight(activity: Dict[str, Any]) -> int:
+    """Attempts an entry stands for; summarized failed logins cover several"""
+    return (activity.get("metadata") or {}).get("attempts", 1)
+
+def rollup_counts(activities: Iterable[Dict[str, Any]]) -> Tuple[Counter, Counter]:
+    """Count activities per report-rollup key and per IP-rollup key"""
+    by_report: Counter = Counter()
+    by_ip: Counter = Counter()
+    for activity in activities:
+        report_id = (activity.get("metadata") or {}).get("report_id")
+        weight = activity_weight(activity)
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(activity["timestamp"], granularity)
+            by_report[(granularity, bucket, activity.get("company_id"), report_id, activity["activity_type"])] += weight
+            if activity.get("ip_address"):
+                by_ip[(granularity, bucket, activity["ip_address"], activity["activity_type"])] += weight
+    return by_report, by_ip
+
+def _increments(counts: Counter, key_fields: Tuple[str, ...]) -> List[UpdateOne]:
+    return [
+        UpdateOne(dict(zip(key_fields, key)), {"$inc": {"count": count}}, upsert=True)
+        for key, count in counts.items()
+    ]
+
+async def _replace_counts(collection, key_fields: Tuple[str, ...], granularity: str, groups) -> int:
+    """Upsert each aggregated group's count over its rollup document.
+
+    Written as upserts on the unique key rather than $merge, which rejects
+    null "on" fields such as a login's report_id or an old entry's company_id.
+    """
+    written = 0
+    requests = []
+    async for group in groups:
+        key = {"granularity": granularity, **group["_id"]}
+        requests.append(UpdateOne(
+            {field: key[field] for field in key_fields},
+            {"$set": {"count": group["count"]}},
+            upsert=True
+        ))
+        if len(requests) >= BACKFILL_BATCH_SIZE:
+            await collection.bulk_write(requests, ordered=False)
+            written += len(requests)
+            requests = []
+    if requests:
+        await collection.bulk_write(requests, ordered=False)
+        written += len(requests)
+    return written
+
+class ActivityRollups:
+    """Hourly and daily activity counts per (company, report, activity type)
+    and per (IP, activity type), kept in db.activity_rollups and db.ip_rollups"""
+
+    def __init__(self):
+        self.recorded = 0
+        self.upserts = 0
+        self.failed = 0
+
+    async def record(self, db: AsyncIOMotorDatabase, activities: List[Dict[str, Any]]):
+        """Fold a batch of new activity log documents into the rollups"""
+        if not activities:
+            return
+        by_report, by_ip = rollup_counts(activities)
+        try:
+            # Each batch collapses to one $inc per distinct key
+            await db.activity_rollups.bulk_write(_increments(by_report, REPORT_ROLLUP_KEY), ordered=False)
+            if by_ip:
+                await db.ip_rollups.bulk_write(_increments(by_ip, IP_ROLLUP_KEY), ordered=False)
+        except Exception as e:
+            self.failed += len(activities)
+            logger.error(f"Failed to update activity rollups: {str(e)}")
+            return
+        self.recorded += len(activities)
+        self.upserts += len(by_report) + len(by_ip)
+
+    async def backfill(
+        self,
+        db: AsyncIOMotorDatabase,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ):
+        """Rebuild the rollups for [since, until) from activity_logs with an
+        aggregation pipeline, replacing the counts of every key it covers.
+
+        Windows should start and end on day boundaries, or the partial
+        first and last days are replaced by partial counts.
+        """
+        match: Dict[str, Any] = {}
+        if since or until:
+            match["timestamp"] = {}
+            if since:
+                match["timestamp"]["$gte"] = since
+            if until:
+                match["timestamp"]["$lt"] = until
+
+        for granularity in GRANULARITIES:
+            bucket = {"$dateTrunc": {"date": "$timestamp", "unit": granularity}}
+            await _replace_counts(db.activity_rollups, REPORT_ROLLUP_KEY, granularity, db.activity_logs.aggregate([
+                {"$match": match},
+                {"$group": {
+                    "_id": {
+                        "bucket": bucket,
+                        "company_id": {"$ifNull": ["$company_id", None]},
+                        "report_id": {"$ifNull": ["$metadata.report_id", None]},
+                        "activity_type": "$activity_type",
+                    },
+                    "count": {"$sum": {"$ifNull": ["$metadata.attempts", 1]}},
+                }},
+            ]))
+            await _replace_counts(db.ip_rollups, IP_ROLLUP_KEY, granularity, db.activity_logs.aggregate([
+                {"$match": {**match, "ip_address": {"$type": "string"}}},
+                {"$group": {
+                    "_id": {"bucket": bucket, "ip_address": "$ip_address", "activity_type": "$activity_type"},
+                    "count": {"$sum": {"$ifNull": ["$metadata.attempts", 1]}},
+                }},
+            ]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recorded": self.recorded,
+            "upserts": self.upserts,
+            "failed": self.failed,
+        }
+
+# Shared rollups fed by the activity log sink
+activity_rollups = ActivityRollups()
@@ -1,35 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request, Query
 from fastapi.responses import HTMLResponse, FileResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List, Optional
 from datetime import datetime
+import asyncio
 import os
-import aiofiles
 import uuid
 import shutil
-import zipfile
 from pathlib import Path
 
 from models import (
     User, UserCreate, UserResponse, UserUpdate,
     Company, CompanyCreate, Report, ReportCreate, ReportUpdate, 
     DashboardStats, ActivityLog, ActivityType, ReportStatus,
-    FileUploadResponse
+    FileUploadResponse, IngestionFile, IngestionJob, TrendPoint, SharingFlag
+)
+from auth import (
+    get_admin_user, get_password_hash, get_client_ip, principal_cache,
+    invalidate_user_sessions, invalidate_company_sessions, BCRYPT_ROUNDS, rehash_stats
 )
-from auth import get_admin_user, get_password_hash, get_client_ip
 from database import get_database
-from utils import log_activity, sanitize_filename, format_file_size
-from email_service import send_email, send_email_bulk, get_welcome_email_html, get_new_report_email_html
+from utils import log_activity, activity_log_filter, sanitize_filename, format_file_size
+from hash_executor import password_executor
+from activity_sink import activity_sink
+from uploads import save_upload_stream, MAX_UPLOAD_REQUEST_SIZE
+from ingestion import ingestion_worker
+from email_outbox import outbox_worker, new_outbox_message
+from view_tokens import get_view_token_store
+from report_cache import report_cache
+from counters import (
+    dashboard_counters, ACTIVE_COMPANIES, ACTIVE_USERS, PUBLISHED_REPORTS, ACTIVITY_LOGS
+)
+from rollups import activity_rollups, GRANULARITIES
+from sharing import sharing_detector
+from login_throttle import get_login_throttle, failed_login_log
+from pagination import fetch_page, page_response, fields_projection, prefix_filter
+from email_service import send_email_bulk, PORTAL_URL
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
-# Portal URL for email links
-PORTAL_URL = os.environ.get("PORTAL_URL", "https://secure-report-viewer.preview.emergentagent.com")
-
 # File storage configuration
 UPLOAD_DIR = Path("/app/uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Upper bound on points returned by a trend query
+TREND_MAX_POINTS = int(os.environ.get("TREND_MAX_POINTS", "5000"))
+
+# Hard cap on activity log page size
+ACTIVITY_LOG_MAX_PAGE_SIZE = int(os.environ.get("ACTIVITY_LOG_MAX_PAGE_SIZE", "500"))
+
 ALLOWED_FILE_TYPES = ["html", "pdf", "png", "jpg", "jpeg", "gif", "csv", "xlsx", "docx", "zip"]
 
 @router.get("/dashboard", response_model=DashboardStats)
@@ -38,24 +57,48 @@ async def get_dashboard_stats(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get dashboard statistics for admin"""
-    # Get counts
-    total_companies = await db.companies.count_documents({"active": True})
-    total_users = await db.users.count_documents({"active": True})
-    total_reports = await db.reports.count_documents({"status": ReportStatus.PUBLISHED})
-    total_access_logs = await db.activity_logs.count_documents({})
-    
-    # Get recent activities
-    recent_activities_cursor = db.activity_logs.find().sort("timestamp", -1).limit(10)
-    recent_activities = await recent_activities_cursor.to_list(length=10)
+    # Totals come from maintained counters, so cost does not grow with the data
+    counts, recent_activities = await asyncio.gather(
+        dashboard_counters.snapshot(db),
+        db.activity_logs.find().sort("timestamp", -1).limit(10).to_list(length=10)
+    )
     
     return DashboardStats(
-        total_companies=total_companies,
-        total_users=total_users,
-        total_reports=total_reports,
-        total_access_logs=total_access_logs,
+        total_companies=counts[ACTIVE_COMPANIES],
+        total_users=counts[ACTIVE_USERS],
+        total_reports=counts[PUBLISHED_REPORTS],
+        total_access_logs=counts[ACTIVITY_LOGS],
         recent_activities=[ActivityLog(**activity) for activity in recent_activities]
     )
 
+@router.get("/metrics")
+async def get_metrics(
+    admin_user: User = Depends(get_admin_user)
+):
+    """Get in-process performance metrics for monitoring"""
+    return {
+        "password_hashing": password_executor.stats(),
+        "password_rehash": {"bcrypt_rounds": BCRYPT_ROUNDS, **rehash_stats},
+        "principal_cache": principal_cache.stats(),
+        "activity_log_sink": activity_sink.stats(),
+        "ingestion": ingestion_worker.stats(),
+        "email_outbox": outbox_worker.stats(),
+        "view_tokens": get_view_token_store().stats(),
+        "report_cache": report_cache.stats(),
+        "dashboard_counters": dashboard_counters.stats(),
+        "activity_rollups": activity_rollups.stats(),
+        "sharing_detector": sharing_detector.stats(),
+        "login_throttle": {**get_login_throttle().stats(), "failed_logins": failed_login_log.stats()}
+    }
+
+@router.get("/email-outbox")
+async def get_email_outbox_stats(
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get email outbox backlog, throughput and dead-letter counts"""
+    return await outbox_worker.summary(db)
+
 # Company Management
 @router.post("/companies", response_model=Company)
 async def create_company(
@@ -75,23 +118,39 @@ async def create_company(
     
     company = Company(**company_data.dict())
     await db.companies.insert_one(company.dict())
+    if company.active:
+        await dashboard_counters.increment(db, ACTIVE_COMPANIES)
     
     # Log activity
     await log_activity(
         db, admin_user.id, admin_user.email, ActivityType.COMPANY_CREATE,
-        f"Created company: {company.name}", get_client_ip(request)
+        f"Created company: {company.name}", get_client_ip(request),
+        company_id=company.id
     )
     
     return company
 
 @router.get("/companies", response_model=List[Company])
 async def get_companies(
+    active: Optional[bool] = None,
+    name_prefix: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=1000),
     admin_user: User = Depends(get_admin_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get all companies"""
-    companies = await db.companies.find().limit(1000).to_list(length=1000)
-    return [Company(**company) for company in companies]
+    """Get companies, newest first. Pass the X-Next-Cursor response header
+    back as cursor= to fetch the next page."""
+    filter_query = {}
+    if active is not None:
+        filter_query["active"] = active
+    if name_prefix:
+        filter_query["name"] = prefix_filter(name_prefix)
+    
+    projection = fields_projection(fields, Company)
+    companies, next_cursor = await fetch_page(db.companies, filter_query, limit, cursor, projection)
+    return page_response(companies, next_cursor, Company, partial=projection is not None)
 
 # User Management
 @router.post("/users", response_model=UserResponse)
@@ -102,7 +161,7 @@ async def create_user(
     admin_user: User = Depends(get_admin_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Create a new user. Set send_notification=true to email credentials."""
+    """Create a new user. Set send_notification=true to queue a credentials email."""
     # Check if user already exists
     existing = await db.users.find_one({"email": user_data.email})
     if existing:
@@ -124,49 +183,106 @@ async def create_user(
     
     # Create user with hashed password
     user_dict = user_data.dict()
-    hashed_password = get_password_hash(user_dict.pop("password"))
+    hashed_password = await get_password_hash(user_dict.pop("password"))
     user_dict["hashed_password"] = hashed_password
     
     user = User(**user_dict)
     await db.users.insert_one(user.dict())
+    if user.active:
+        await dashboard_counters.increment(db, ACTIVE_USERS)
     
     # Log activity
     await log_activity(
         db, admin_user.id, admin_user.email, ActivityType.USER_CREATE,
         f"Created user: {user.email} for company: {company['name']}",
-        get_client_ip(request)
+        get_client_ip(request),
+        company_id=user.company_id
     )
     
     # Send welcome email if requested
     if send_notification:
-        html_content = get_welcome_email_html(
-            user_name=user.full_name,
-            user_email=user.email,
-            password=original_password,
-            company_name=company['name'],
-            portal_url=PORTAL_URL
-        )
-        await send_email(
+        # The password is rendered at send time and never stored in the outbox
+        message = new_outbox_message(
             recipient_email=user.email,
             subject="Bienvenido al Portal de Clientes - InsightPlace",
-            html_content=html_content
+            html_content=None,
+            kind="welcome",
+            metadata={"user_id": user.id},
+            template="welcome",
+            params={
+                "user_name": user.full_name,
+                "user_email": user.email,
+                "company_name": company['name'],
+                "portal_url": PORTAL_URL,
+            }
         )
+        await outbox_worker.enqueue(db, [message], secrets={message["id"]: {"password": original_password}})
     
     return UserResponse(**user.dict())
 
 @router.get("/users", response_model=List[UserResponse])
 async def get_users(
     company_id: Optional[str] = None,
+    active: Optional[bool] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=1000),
     admin_user: User = Depends(get_admin_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get all users, optionally filtered by company"""
+    """Get users, newest first, optionally filtered by company.
+    Pass the X-Next-Cursor response header back as cursor= for the next page."""
     filter_query = {}
     if company_id:
         filter_query["company_id"] = company_id
+    if active is not None:
+        filter_query["active"] = active
+    
+    requested = fields_projection(fields, UserResponse)
+    # Never load password hashes just to drop them
+    projection = requested or {"hashed_password": 0}
+    users, next_cursor = await fetch_page(db.users, filter_query, limit, cursor, projection)
+    return page_response(users, next_cursor, UserResponse, partial=requested is not None)
+
+@router.put("/users/{user_id}", response_model=UserResponse)
+async def update_user(
+    user_id: str,
+    user_data: UserUpdate,
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Update a user's details or deactivate the account"""
+    user = await db.users.find_one({"id": user_id})
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
     
-    users = await db.users.find(filter_query).limit(1000).to_list(length=1000)
-    return [UserResponse(**user) for user in users]
+    update_data = user_data.dict(exclude_unset=True)
+    if update_data.get("active") is False and user["id"] == admin_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot deactivate your own account"
+        )
+    
+    if "email" in update_data and update_data["email"] != user["email"]:
+        existing = await db.users.find_one({"email": update_data["email"]})
+        if existing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="User with this email already exists"
+            )
+    
+    if update_data:
+        update_data["updated_at"] = datetime.utcnow()
+        await db.users.update_one({"id": user_id}, {"$set": update_data})
+        if "active" in update_data and update_data["active"] != user.get("active", True):
+            await dashboard_counters.increment(db, ACTIVE_USERS, 1 if update_data["active"] else -1)
+        user.update(update_data)
+        invalidate_user_sessions(user_id)
+    
+    return UserResponse(**user)
 
 @router.delete("/users/{user_id}")
 async def delete_user(
@@ -193,12 +309,16 @@ async def delete_user(
     
     # Delete user
     await db.users.delete_one({"id": user_id})
+    if user.get("active", True):
+        await dashboard_counters.increment(db, ACTIVE_USERS, -1)
+    invalidate_user_sessions(user_id)
     
     # Log activity
     await log_activity(
         db, admin_user.id, admin_user.email, ActivityType.USER_DELETE,
         f"Deleted user: {user['email']}",
-        get_client_ip(request)
+        get_client_ip(request),
+        company_id=user.get("company_id")
     )
     
     return {"message": "User deleted successfully"}
@@ -226,26 +346,36 @@ async def delete_company(
             detail="Cannot delete your own company"
         )
     
-    # Delete all users in this company
+    # Delete all users in this company; active ones first so the counter
+    # moves by what was actually deleted
+    active_users = await db.users.delete_many({"company_id": company_id, "active": True})
     await db.users.delete_many({"company_id": company_id})
-    
-    # Delete all reports for this company
+    await dashboard_counters.increment(db, ACTIVE_USERS, -active_users.deleted_count)
+    invalidate_company_sessions(company_id)
+
+    # Delete all reports for this company, published ones first
+    published_reports = await db.reports.delete_many({"company_id": company_id, "status": ReportStatus.PUBLISHED})
     await db.reports.delete_many({"company_id": company_id})
-    
+    await dashboard_counters.increment(db, PUBLISHED_REPORTS, -published_reports.deleted_count)
+    report_cache.invalidate_company(company_id)
+
     # Delete company
-    await db.companies.delete_one({"id": company_id})
+    deleted = await db.companies.delete_one({"id": company_id})
+    if deleted.deleted_count and company.get("active", True):
+        await dashboard_counters.increment(db, ACTIVE_COMPANIES, -1)
     
     # Log activity
     await log_activity(
         db, admin_user.id, admin_user.email, ActivityType.COMPANY_DELETE,
         f"Deleted company: {company['name']} and all associated data",
-        get_client_ip(request)
+        get_client_ip(request),
+        company_id=company_id
     )
     
     return {"message": "Company deleted successfully"}
 
 # Report Management
-@router.post("/reports/upload")
+@router.post("/reports/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_report(
     request: Request,
     admin_user: User = Depends(get_admin_user),
@@ -257,7 +387,9 @@ async def upload_report(
     notify_users: str = Form("false"),
     files: List[UploadFile] = File(...)
 ):
-    """Upload report files. Set notify_users=true to email all company users."""
+    """Upload report files and queue them for ingestion.
+    Set notify_users=true to email all company users once the report is published.
+    Poll GET /api/admin/jobs/{job_id} for extraction and notification progress."""
     # Verify company exists
     company = await db.companies.find_one({"id": company_id})
     if not company:
@@ -274,152 +406,275 @@ async def upload_report(
     company_dir = UPLOAD_DIR / sanitize_filename(company["name"]) / sanitize_filename(title)
     company_dir.mkdir(parents=True, exist_ok=True)
     
-    uploaded_files = []
-    main_file = None
+    saved_files = []
     total_size = 0
     
-    for file in files:
-        if not file.filename:
-            continue
-            
-        # Validate file type
-        file_ext = file.filename.split('.')[-1].lower()
-        if file_ext not in ALLOWED_FILE_TYPES:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File type .{file_ext} not allowed"
-            )
-        
-        # Save file
-        safe_filename = sanitize_filename(file.filename)
-        file_path = company_dir / safe_filename
-        
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-            total_size += len(content)
-        
-        # Handle ZIP files - extract them
-        if file_ext == 'zip':
-            try:
-                with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                    zip_ref.extractall(company_dir)
-                
-                # Find all extracted files
-                for extracted_file in company_dir.rglob('*'):
-                    if extracted_file.is_file() and extracted_file != file_path:
-                        # Skip macOS metadata files and __MACOSX folder
-                        if '__MACOSX' in str(extracted_file) or extracted_file.name.startswith('._'):
-                            continue
-                        
-                        relative_path = str(extracted_file.relative_to(UPLOAD_DIR))
-                        uploaded_files.append(relative_path)
-                        
-                        # Set main file if it's Main.html or index.html (preferred names)
-                        if extracted_file.suffix.lower() == '.html' and not main_file:
-                            if extracted_file.name.lower() in ['main.html', 'index.html']:
-                                main_file = relative_path
+    try:
+        for file in files:
+            if not file.filename:
+                continue
                 
-                # If no Main.html or index.html found, pick first HTML file
-                if not main_file:
-                    for f in uploaded_files:
-                        if f.lower().endswith('.html'):
-                            main_file = f
-                            break
-                
-                # Keep the ZIP file for downloads (don't delete it)
-                # file_path.unlink()  # Commented out to preserve original ZIP
-            except Exception as e:
-                # If extraction fails, keep the ZIP as is
-                uploaded_files.append(str(file_path.relative_to(UPLOAD_DIR)))
-        else:
-            uploaded_files.append(str(file_path.relative_to(UPLOAD_DIR)))
+            # Validate file type
+            file_ext = file.filename.split('.')[-1].lower()
+            if file_ext not in ALLOWED_FILE_TYPES:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"File type .{file_ext} not allowed"
+                )
             
-            # Set main file if it's HTML
-            if file_ext == 'html' and not main_file:
-                main_file = str(file_path.relative_to(UPLOAD_DIR))
-    
-    if not main_file:
-        main_file = uploaded_files[0] if uploaded_files else ""
-    
-    # Create report record
-    report = Report(
+            # Save file
+            safe_filename = sanitize_filename(file.filename)
+            file_path = company_dir / safe_filename
+            
+            file_size, file_hash = await save_upload_stream(
+                file, file_path, MAX_UPLOAD_REQUEST_SIZE - total_size
+            )
+            total_size += file_size
+            saved_files.append(IngestionFile(
+                path=str(file_path.relative_to(UPLOAD_DIR)),
+                size=file_size,
+                sha256=file_hash,
+                is_archive=file_ext == 'zip'
+            ))
+    except BaseException:
+        # A rejected request leaves nothing behind, including files saved before the failure
+        for saved in saved_files:
+            (UPLOAD_DIR / saved.path).unlink(missing_ok=True)
+        try:
+            company_dir.rmdir()
+        except OSError:
+            pass
+        raise
+    
+    # Extraction, report creation and notifications run in the background
+    job = IngestionJob(
         title=title,
         description=description,
         company_id=company_id,
-        main_file=main_file,
-        supporting_files=[f for f in uploaded_files if f != main_file],
-        file_size=total_size,
         allow_download=allow_download_bool,
+        notify_users=notify_users_bool,
         uploaded_by=admin_user.id,
-        status=ReportStatus.PUBLISHED
+        uploaded_by_email=admin_user.email,
+        ip_address=get_client_ip(request),
+        files=saved_files
     )
-    
-    await db.reports.insert_one(report.dict())
-    
-    # Log activity
-    await log_activity(
-        db, admin_user.id, admin_user.email, ActivityType.REPORT_UPLOAD,
-        f"Uploaded report '{title}' for {company['name']}",
-        get_client_ip(request),
-        metadata={"report_id": report.id, "file_count": len(uploaded_files)}
-    )
-    
-    # Send notifications to company users if requested
-    notifications_sent = 0
-    if notify_users_bool:
-        company_users = await db.users.find({"company_id": company_id}, {"email": 1, "full_name": 1}).limit(500).to_list(length=500)
-        for user in company_users:
-            html_content = get_new_report_email_html(
-                user_name=user.get("full_name", "Usuario"),
-                report_title=title,
-                company_name=company["name"],
-                portal_url=PORTAL_URL
-            )
-            await send_email(
-                recipient_email=user["email"],
-                subject=f"Nuevo Reporte Disponible: {title}",
-                html_content=html_content
-            )
-            notifications_sent += 1
+    await ingestion_worker.submit(db, job)
     
     return {
-        "message": "Report uploaded successfully",
-        "report_id": report.id,
-        "files_uploaded": len(uploaded_files),
+        "message": "Report upload accepted for processing",
+        "job_id": job.id,
+        "report_id": job.report_id,
+        "status": job.status,
+        "files_uploaded": len(saved_files),
         "total_size": format_file_size(total_size),
-        "notifications_sent": notifications_sent
+        "notifications_sent": 0
     }
 
+@router.get("/jobs/{job_id}", response_model=IngestionJob)
+async def get_ingestion_job(
+    job_id: str,
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get the stage, progress and errors of a report ingestion job"""
+    job = await db.ingestion_jobs.find_one({"id": job_id})
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    return IngestionJob(**job)
+
 @router.get("/reports", response_model=List[Report])
 async def get_reports(
     admin_user: User = Depends(get_admin_user),
     company_id: Optional[str] = None,
+    status_filter: Optional[ReportStatus] = Query(None, alias="status"),
+    tag: Optional[str] = None,
+    title_prefix: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=500),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get all reports, optionally filtered by company"""
+    """Get reports, newest first, filtered by company, status, tag or title prefix.
+    Pass the X-Next-Cursor response header back as cursor= for the next page."""
     filter_query = {}
     if company_id:
         filter_query["company_id"] = company_id
+    if status_filter:
+        filter_query["status"] = status_filter
+    if tag:
+        filter_query["tags"] = tag
+    if title_prefix:
+        filter_query["title"] = prefix_filter(title_prefix)
+    
+    requested = fields_projection(fields, Report)
+    reports, next_cursor = await fetch_page(db.reports, filter_query, limit, cursor, requested or {"manifest": 0})
+    return page_response(reports, next_cursor, Report, partial=requested is not None)
+
+@router.put("/reports/{report_id}", response_model=Report)
+async def update_report(
+    report_id: str,
+    report_data: ReportUpdate,
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Update a report's details, status or download permission"""
+    report = await db.reports.find_one({"id": report_id}, {"manifest": 0})
+    if not report:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Report not found"
+        )
+    
+    update_data = report_data.dict(exclude_unset=True)
+    if update_data:
+        update_data["updated_at"] = datetime.utcnow()
+        await db.reports.update_one({"id": report_id}, {"$set": update_data})
+        if "status" in update_data:
+            was_published = report.get("status") == ReportStatus.PUBLISHED
+            is_published = update_data["status"] == ReportStatus.PUBLISHED
+            await dashboard_counters.increment(db, PUBLISHED_REPORTS, int(is_published) - int(was_published))
+        report.update(update_data)
+        report_cache.invalidate(report_id)
+    
+    return Report(**report)
+
+@router.delete("/reports/{report_id}")
+async def delete_report(
+    report_id: str,
+    request: Request,
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Delete a report"""
+    report = await db.reports.find_one({"id": report_id}, {"manifest": 0})
+    if not report:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Report not found"
+        )
+    
+    await db.reports.delete_one({"id": report_id})
+    if report.get("status") == ReportStatus.PUBLISHED:
+        await dashboard_counters.increment(db, PUBLISHED_REPORTS, -1)
+    report_cache.invalidate(report_id)
     
-    reports = await db.reports.find(filter_query).sort("created_at", -1).limit(500).to_list(length=500)
-    return [Report(**report) for report in reports]
+    # Log activity
+    await log_activity(
+        db, admin_user.id, admin_user.email, ActivityType.REPORT_DELETE,
+        f"Deleted report: {report['title']}",
+        get_client_ip(request),
+        metadata={"report_id": report_id},
+        company_id=report["company_id"]
+    )
+    
+    return {"message": "Report deleted successfully"}
 
 # Activity Logs
 @router.get("/activity-logs", response_model=List[ActivityLog])
 async def get_activity_logs(
     admin_user: User = Depends(get_admin_user),
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=ACTIVITY_LOG_MAX_PAGE_SIZE),
     user_id: Optional[str] = None,
-    activity_type: Optional[str] = None,
+    activity_type: Optional[ActivityType] = None,
+    ip_address: Optional[str] = None,
+    report_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get activity logs"""
-    filter_query = {}
-    if user_id:
-        filter_query["user_id"] = user_id
-    if activity_type:
-        filter_query["activity_type"] = activity_type
+    """Get activity logs, newest first, within an optional [since, until) window.
+    Filters combine; pass the X-Next-Cursor response header back as cursor= for the next page."""
+    filter_query = activity_log_filter(
+        user_id=user_id,
+        activity_type=activity_type.value if activity_type else None,
+        ip_address=ip_address,
+        report_id=report_id,
+        since=since,
+        until=until
+    )
     
-    logs = await db.activity_logs.find(filter_query).sort("timestamp", -1).limit(limit).to_list(length=limit)
-    return [ActivityLog(**log) for log in logs]
+    logs, next_cursor = await fetch_page(
+        db.activity_logs, filter_query, limit, cursor, {"_id": 0}, sort_field="timestamp"
+    )
+    return page_response(logs, next_cursor, ActivityLog)
+
+# Activity Trends
+def _trend_filter(granularity: str, since: Optional[datetime], until: Optional[datetime], **fields) -> dict:
+    if granularity not in GRANULARITIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"granularity must be one of: {', '.join(GRANULARITIES)}"
+        )
+    filter_query = {"granularity": granularity}
+    if since or until:
+        filter_query["bucket"] = {}
+        if since:
+            filter_query["bucket"]["$gte"] = since
+        if until:
+            filter_query["bucket"]["$lt"] = until
+    filter_query.update({key: value for key, value in fields.items() if value is not None})
+    return filter_query
+
+@router.get("/trends/reports", response_model=List[TrendPoint])
+async def get_report_trends(
+    granularity: str = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    company_id: Optional[str] = None,
+    report_id: Optional[str] = None,
+    activity_type: Optional[ActivityType] = None,
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Activity counts per hour or day, by company, report and activity type"""
+    filter_query = _trend_filter(
+        granularity, since, until,
+        company_id=company_id, report_id=report_id,
+        activity_type=activity_type.value if activity_type else None
+    )
+    points = await db.activity_rollups.find(filter_query, {"_id": 0, "granularity": 0}).sort("bucket", 1).limit(TREND_MAX_POINTS).to_list(length=TREND_MAX_POINTS)
+    return [TrendPoint(**point) for point in points]
+
+@router.get("/trends/ips", response_model=List[TrendPoint])
+async def get_ip_trends(
+    granularity: str = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    ip_address: Optional[str] = None,
+    activity_type: Optional[ActivityType] = None,
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Activity counts per hour or day by client IP, e.g. failed logins per IP"""
+    filter_query = _trend_filter(
+        granularity, since, until,
+        ip_address=ip_address,
+        activity_type=activity_type.value if activity_type else None
+    )
+    points = await db.ip_rollups.find(filter_query, {"_id": 0, "granularity": 0}).sort("bucket", 1).limit(TREND_MAX_POINTS).to_list(length=TREND_MAX_POINTS)
+    return [TrendPoint(**point) for point in points]
+
+# Password Sharing
+@router.get("/sharing-flags", response_model=List[SharingFlag])
+async def get_sharing_flags(
+    since: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Accounts that look shared, most recently flagged first, with the IPs,
+    user agents, concurrent view tokens and network switches behind each flag.
+    Pass the X-Next-Cursor response header back as cursor= for the next page."""
+    filter_query = {}
+    if since:
+        filter_query["last_flagged_at"] = {"$gte": since}
+    flags, next_cursor = await fetch_page(
+        db.sharing_flags, filter_query, limit, cursor, {"_id": 0}, sort_field="last_flagged_at"
+    )
+    return page_response(flags, next_cursor, SharingFlag)
@@ -16,7 +16,7 @@ from models import (
 )
 from auth import (
     authenticate_user, create_access_token, get_current_user, get_admin_user,
-    get_password_hash, get_client_ip
+    get_password_hash, get_client_ip, get_throttle_ip
 )
 from database import get_database
 from utils import log_activity, sanitize_filename, format_file_size
@@ -34,7 +34,8 @@ async def login(
     user_agent = request.headers.get("User-Agent", "Unknown")
     
     user = await authenticate_user(
-        db, login_data.email, login_data.password, ip_address
+        db, login_data.email, login_data.password, ip_address, user_agent,
+        throttle_ip=get_throttle_ip(request)
     )
     
     if not user:
@@ -97,7 +98,8 @@ async def logout(
     
     await log_activity(
         db, current_user.id, current_user.email, ActivityType.LOGOUT,
-        f"User logged out: {current_user.email}", ip_address
+        f"User logged out: {current_user.email}", ip_address,
+        company_id=current_user.company_id
     )
     
     return {"message": "Successfully logged out"}
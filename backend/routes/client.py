@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
-from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Query
+from fastapi.responses import HTMLResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List, Optional
 from pathlib import Path
@@ -14,55 +14,63 @@ from models import User, Report, Company, ActivityType
 from auth import get_current_user, get_client_ip, get_user_from_token
 from database import get_database
 from utils import log_activity
+from view_tokens import get_view_token_store
+from sharing import sharing_detector
+from file_serving import asset_response, download_response, file_response, guess_content_type
+from report_cache import report_cache, manifest_key
+from pagination import fetch_page, page_response, fields_projection, prefix_filter
 
 router = APIRouter(prefix="/api/client", tags=["client"])
 
 UPLOAD_DIR = Path("/app/uploads")
 
-def normalize_path(path_str: str) -> str:
-    """Normalize Unicode characters in path to handle Mac NFD vs NFC differences"""
-    return unicodedata.normalize('NFD', path_str)
+VIEW_TOKEN_TTL = timedelta(minutes=30)  # Token valid for 30 minutes
 
-# Store for temporary view tokens (in production, use Redis)
-view_tokens = {}
-
-def generate_view_token(user_id: str, report_id: str) -> str:
+async def generate_view_token(user_id: str, report_id: str, user_email: Optional[str] = None) -> str:
     """Generate a short-lived token for secure viewing"""
     token = secrets.token_urlsafe(32)
-    expiry = datetime.utcnow() + timedelta(minutes=30)  # Token valid for 30 minutes
-    view_tokens[token] = {
+    issued_at = datetime.utcnow()
+    expiry = issued_at + VIEW_TOKEN_TTL
+    await get_view_token_store().put(token, {
         "user_id": user_id,
         "report_id": report_id,
         "expiry": expiry
-    }
+    })
+    sharing_detector.observe_token(user_id, user_email, issued_at, expiry)
     return token
 
-def validate_view_token(token: str, report_id: str) -> bool:
+async def validate_view_token(token: str, report_id: str) -> bool:
     """Validate a view token"""
-    if token not in view_tokens:
+    token_data = await get_view_token_store().get(token)
+    if token_data is None:
         return False
     
-    token_data = view_tokens[token]
-    if token_data["report_id"] != report_id:
-        return False
-    if datetime.utcnow() > token_data["expiry"]:
-        del view_tokens[token]
-        return False
-    
-    return True
+    return token_data["report_id"] == report_id
 
 @router.get("/reports", response_model=List[Report])
 async def get_client_reports(
+    tag: Optional[str] = None,
+    title_prefix: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
     current_user: User = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get reports for current user's company"""
-    reports = await db.reports.find({
+    """Get reports for current user's company, newest first.
+    Pass the X-Next-Cursor response header back as cursor= for the next page."""
+    filter_query = {
         "company_id": current_user.company_id,
         "status": "published"
-    }).sort("created_at", -1).limit(100).to_list(length=100)
-    
-    return [Report(**report) for report in reports]
+    }
+    if tag:
+        filter_query["tags"] = tag
+    if title_prefix:
+        filter_query["title"] = prefix_filter(title_prefix)
+    
+    requested = fields_projection(fields, Report)
+    reports, next_cursor = await fetch_page(db.reports, filter_query, limit, cursor, requested or {"manifest": 0})
+    return page_response(reports, next_cursor, Report, partial=requested is not None)
 
 @router.get("/reports/{report_id}", response_model=Report)
 async def get_report(
@@ -77,13 +85,13 @@ async def get_report(
         report = await db.reports.find_one({
             "id": report_id,
             "status": "published"
-        })
+        }, {"manifest": 0})
     else:
         report = await db.reports.find_one({
             "id": report_id,
             "company_id": current_user.company_id,
             "status": "published"
-        })
+        }, {"manifest": 0})
     
     if not report:
         raise HTTPException(
@@ -102,7 +110,9 @@ async def get_report(
         db, current_user.id, current_user.email, ActivityType.REPORT_VIEW,
         f"Viewed report: {report['title']}",
         get_client_ip(request),
-        metadata={"report_id": report_id}
+        request.headers.get("User-Agent"),
+        metadata={"report_id": report_id},
+        company_id=report["company_id"]
     )
     
     return Report(**report)
@@ -118,7 +128,7 @@ async def get_secure_view_token(
         "id": report_id,
         "company_id": current_user.company_id,
         "status": "published"
-    })
+    }, {"manifest": 0})
     
     if not report:
         raise HTTPException(
@@ -126,11 +136,11 @@ async def get_secure_view_token(
             detail="Report not found"
         )
     
-    token = generate_view_token(current_user.id, report_id)
+    token = await generate_view_token(current_user.id, report_id, current_user.email)
     
     return {
         "token": token,
-        "expires_in": 1800,  # 30 minutes in seconds
+        "expires_in": int(VIEW_TOKEN_TTL.total_seconds()),
         "allow_download": report.get("allow_download", False)
     }
 
@@ -160,17 +170,9 @@ async def view_report_file(
         )
     
     # Admin can access all reports, clients only their company's
-    if current_user.role == 'admin':
-        report = await db.reports.find_one({
-            "id": report_id,
-            "status": "published"
-        })
-    else:
-        report = await db.reports.find_one({
-            "id": report_id,
-            "company_id": current_user.company_id,
-            "status": "published"
-        })
+    report = await report_cache.get(db, report_id)
+    if report and current_user.role != 'admin' and report["company_id"] != current_user.company_id:
+        report = None
     
     if not report:
         raise HTTPException(
@@ -191,14 +193,16 @@ async def view_report_file(
         db, current_user.id, current_user.email, ActivityType.REPORT_VIEW,
         f"Opened report file: {report['title']}",
         get_client_ip(request),
-        metadata={"report_id": report_id, "file": report["main_file"]}
+        request.headers.get("User-Agent"),
+        metadata={"report_id": report_id, "file": report["main_file"]},
+        company_id=report["company_id"]
     )
     
     # Serve the HTML file directly - no token injection needed
     # Embedded assets will load freely (security is at Main.html level)
-    return FileResponse(
+    return file_response(
         file_path,
-        media_type="text/html",
+        "text/html",
         headers={
             "Cache-Control": "no-store, no-cache, must-revalidate, private",
             "Pragma": "no-cache",
@@ -237,11 +241,9 @@ async def get_report_asset(
             detail="Not authenticated"
         )
     
-    report = await db.reports.find_one({
-        "id": report_id,
-        "company_id": current_user.company_id,
-        "status": "published"
-    })
+    report = await report_cache.get(db, report_id)
+    if report and report["company_id"] != current_user.company_id:
+        report = None
     
     if not report:
         raise HTTPException(
@@ -252,7 +254,21 @@ async def get_report_asset(
     # Get the report's directory
     main_file_path = Path(report["main_file"])
     report_dir = UPLOAD_DIR / main_file_path.parent
-    asset_path = report_dir / file_name
+    
+    index = report["assets"]
+    if index:
+        # Manifest paths were confined to the report directory at ingestion,
+        # so a hit needs no filesystem checks before serving
+        entry = index.get(manifest_key(file_name))
+        if entry is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Asset not found"
+            )
+        content_type = entry.get("content_type") or guess_content_type(Path(entry["path"]))
+        return asset_response(request, report_dir / entry["path"], content_type, entry)
+    
+    asset_path = report_dir / unicodedata.normalize('NFC', file_name)
     
     # Security: ensure the asset is within the report directory
     try:
@@ -270,31 +286,9 @@ async def get_report_asset(
         )
     
     # Determine content type
-    suffix = asset_path.suffix.lower()
-    content_types = {
-        ".png": "image/png",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".gif": "image/gif",
-        ".svg": "image/svg+xml",
-        ".css": "text/css",
-        ".js": "application/javascript",
-        ".json": "application/json",
-        ".html": "text/html",
-        ".woff": "font/woff",
-        ".woff2": "font/woff2",
-        ".ttf": "font/ttf",
-        ".eot": "application/vnd.ms-fontobject",
-    }
-    content_type = content_types.get(suffix, "application/octet-stream")
+    content_type = guess_content_type(asset_path)
     
-    return FileResponse(
-        asset_path,
-        media_type=content_type,
-        headers={
-            "Cache-Control": "no-store, no-cache, must-revalidate, private",
-        }
-    )
+    return asset_response(request, asset_path, content_type)
 
 @router.get("/reports/{report_id}/download")
 async def download_report(
@@ -312,13 +306,13 @@ async def download_report(
         report = await db.reports.find_one({
             "id": report_id,
             "status": "published"
-        })
+        }, {"manifest": 0})
     else:
         report = await db.reports.find_one({
             "id": report_id,
             "company_id": current_user.company_id,
             "status": "published"
-        })
+        }, {"manifest": 0})
     
     if not report:
         raise HTTPException(
@@ -355,31 +349,38 @@ async def download_report(
     
     # Use the original ZIP file
     zip_path = existing_zips[0]
-    
-    # Increment download count
-    await db.reports.update_one(
-        {"id": report_id},
-        {"$inc": {"download_count": 1}}
-    )
-    
-    # Log activity
-    await log_activity(
-        db, current_user.id, current_user.email, ActivityType.REPORT_DOWNLOAD,
-        f"Downloaded report archive: {report['title']}",
-        get_client_ip(request),
-        metadata={"report_id": report_id, "file": zip_path.name}
-    )
+    zip_key = str(zip_path.relative_to(UPLOAD_DIR))
+    user_id, user_email = current_user.id, current_user.email
+    client_ip = get_client_ip(request)
+    
+    async def record_download():
+        # Counted once the last byte has been sent, so resumed or parallel
+        # range requests for one download are not counted several times
+        await db.reports.update_one(
+            {"id": report_id},
+            {"$inc": {"download_count": 1}}
+        )
+        await log_activity(
+            db, user_id, user_email, ActivityType.REPORT_DOWNLOAD,
+            f"Downloaded report archive: {report['title']}",
+            client_ip,
+            metadata={"report_id": report_id, "file": zip_path.name},
+            company_id=report["company_id"]
+        )
     
     # Use RFC 5987 encoding for proper Unicode filename support
     ascii_filename = "report.zip"  # Fallback for old browsers
     utf8_filename = quote(zip_path.name)  # RFC 5987 encoded original filename
     
-    return FileResponse(
+    return download_response(
+        request,
         zip_path,
-        media_type="application/zip",
+        "application/zip",
+        sha256=report.get("checksums", {}).get(zip_key),
         headers={
             "Content-Disposition": f"attachment; filename=\"{ascii_filename}\"; filename*=UTF-8''{utf8_filename}"
-        }
+        },
+        on_complete=record_download
     )
 
 @router.get("/company", response_model=Company)
@@ -402,6 +403,7 @@ async def get_company_info(
 async def get_report_relative_asset(
     report_id: str,
     file_path: str,
+    request: Request,
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Serve embedded assets (images, charts, etc.) without authentication.
@@ -413,10 +415,7 @@ async def get_report_relative_asset(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
     
     # Find the report (no company_id check - just verify report exists)
-    report = await db.reports.find_one({
-        "id": report_id,
-        "status": "published"
-    })
+    report = await report_cache.get(db, report_id)
     
     if not report:
         raise HTTPException(
@@ -428,34 +427,20 @@ async def get_report_relative_asset(
     main_file_path = Path(report["main_file"])
     report_dir = UPLOAD_DIR / main_file_path.parent
     
-    # Try to find the file with different Unicode normalizations
-    # Mac uses NFD (decomposed), Windows/Linux typically use NFC (composed)
-    asset_path = report_dir / file_path
-    
-    if not asset_path.exists():
-        # Try NFD normalization (Mac style)
-        nfd_path = report_dir / normalize_path(file_path)
-        if nfd_path.exists():
-            asset_path = nfd_path
-        else:
-            # Try NFC normalization
-            nfc_path = report_dir / unicodedata.normalize('NFC', file_path)
-            if nfc_path.exists():
-                asset_path = nfc_path
-            else:
-                # Last resort: scan directory for matching filename
-                # This handles cases where stored filename differs from request
-                target_dir = report_dir / Path(file_path).parent
-                target_name_nfc = unicodedata.normalize('NFC', Path(file_path).name)
-                target_name_nfd = unicodedata.normalize('NFD', Path(file_path).name)
-                
-                if target_dir.exists():
-                    for f in target_dir.iterdir():
-                        f_name_nfc = unicodedata.normalize('NFC', f.name)
-                        f_name_nfd = unicodedata.normalize('NFD', f.name)
-                        if f_name_nfc == target_name_nfc or f_name_nfd == target_name_nfd or f_name_nfc == target_name_nfd or f_name_nfd == target_name_nfc:
-                            asset_path = f
-                            break
+    index = report["assets"]
+    if index:
+        entry = index.get(manifest_key(file_path))
+        if entry is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Asset not found: {file_path}"
+            )
+        content_type = entry.get("content_type") or guess_content_type(Path(entry["path"]))
+        return asset_response(request, report_dir / entry["path"], content_type, entry)
+    
+    # Reports without a manifest predate ingestion-time NFC naming and have
+    # been renamed by migrations.normalize_upload_paths
+    asset_path = report_dir / unicodedata.normalize('NFC', file_path)
     
     # Security: ensure the asset is within the report directory
     try:
@@ -473,29 +458,7 @@ async def get_report_relative_asset(
         )
     
     # Determine content type
-    suffix = asset_path.suffix.lower()
-    content_types = {
-        ".png": "image/png",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".gif": "image/gif",
-        ".svg": "image/svg+xml",
-        ".css": "text/css",
-        ".js": "application/javascript",
-        ".json": "application/json",
-        ".html": "text/html",
-        ".woff": "font/woff",
-        ".woff2": "font/woff2",
-        ".ttf": "font/ttf",
-        ".eot": "application/vnd.ms-fontobject",
-    }
-    content_type = content_types.get(suffix, "application/octet-stream")
+    content_type = guess_content_type(asset_path)
     
     # Serve all files directly without modification
-    return FileResponse(
-        asset_path,
-        media_type=content_type,
-        headers={
-            "Cache-Control": "no-store, no-cache, must-revalidate, private",
-        }
-    )
+    return asset_response(request, asset_path, content_type)
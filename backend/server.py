@@ -9,7 +9,16 @@ from pathlib import Path
 from dotenv import load_dotenv
 
 # Import database functions
-from database import connect_to_mongo, close_mongo_connection, create_indexes
+from database import connect_to_mongo, close_mongo_connection, create_indexes, get_database
+from hash_executor import password_executor
+from activity_sink import activity_sink
+from uploads import extraction_executor
+from ingestion import ingestion_worker
+from email_outbox import outbox_worker
+from view_tokens import configure_view_token_store, get_view_token_store
+from counters import dashboard_counters
+from sharing import sharing_detector
+from login_throttle import configure_login_throttle, failed_login_log
 
 # Import route modules
 from routes.auth import router as auth_router
@@ -26,8 +35,24 @@ async def lifespan(app: FastAPI):
     await connect_to_mongo()
     await create_indexes()
     await create_admin_user()
+    activity_sink.start(await get_database())
+    sharing_detector.start(await get_database())
+    ingestion_worker.start(await get_database())
+    outbox_worker.start(await get_database())
+    configure_view_token_store(await get_database())
+    configure_login_throttle(await get_database())
+    dashboard_counters.start(await get_database())
     yield
     # Shutdown
+    await dashboard_counters.stop()
+    await ingestion_worker.stop()
+    await outbox_worker.stop()
+    await get_view_token_store().stop()
+    await failed_login_log.stop()
+    await activity_sink.stop()
+    await sharing_detector.stop()
+    password_executor.shutdown()
+    extraction_executor.shutdown(wait=True)
     await close_mongo_connection()
 
 # Create the main app
@@ -45,6 +70,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers
@@ -71,7 +97,6 @@ from pydantic import BaseModel, Field
 from typing import List
 import uuid
 from datetime import datetime
-from database import get_database
 from fastapi import Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
@@ -114,7 +139,6 @@ async def create_admin_user():
     """Create default admin user and company if they don't exist"""
     from auth import get_password_hash
     from models import User, Company, UserRole
-    from database import get_database
     
     db = await get_database()
     
@@ -138,7 +162,7 @@ async def create_admin_user():
             full_name="Admin User",
             company_id=admin_company.id,
             role=UserRole.ADMIN,
-            hashed_password=get_password_hash("admin123")
+            hashed_password=await get_password_hash("admin123")
         )
         await db.users.insert_one(admin_user.dict())
         logger.info("Created admin user: admin@insightplace.com / admin123")
@@ -159,7 +183,7 @@ async def create_admin_user():
             full_name="Carlos Mesa",
             company_id=paloma_company.id,
             role=UserRole.CLIENT,
-            hashed_password=get_password_hash("password123")
+            hashed_password=await get_password_hash("password123")
         )
         await db.users.insert_one(demo_user.dict())
         logger.info("Created demo user: carlos.mesa@palomavalencia.com / password123")
\ No newline at end of file
@@ -0,0 +1,226 @@
+import asyncio
+import ipaddress
+import logging
+import os
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from models import ActivityType
+
+logger = logging.getLogger(__name__)
+
+# Sliding window over which each user's activity is considered
+SHARING_WINDOW = timedelta(seconds=int(os.environ.get("SHARING_WINDOW_SECONDS", str(24 * 3600))))
+# Signals above these limits inside the window flag the account
+SHARING_MAX_IPS = int(os.environ.get("SHARING_MAX_IPS", "4"))
+SHARING_MAX_USER_AGENTS = int(os.environ.get("SHARING_MAX_USER_AGENTS", "4"))
+SHARING_MAX_CONCURRENT_TOKENS = int(os.environ.get("SHARING_MAX_CONCURRENT_TOKENS", "6"))
+SHARING_MAX_IP_SWITCHES = int(os.environ.get("SHARING_MAX_IP_SWITCHES", "3"))
+# Moving to another network within this interval counts as an implausible switch
+SHARING_SWITCH_INTERVAL = timedelta(seconds=int(os.environ.get("SHARING_SWITCH_INTERVAL_SECONDS", "300")))
+# Users tracked in memory; the least recently active are dropped first
+SHARING_MAX_USERS = int(os.environ.get("SHARING_MAX_USERS", "100000"))
+SHARING_FLUSH_INTERVAL = float(os.environ.get("SHARING_FLUSH_INTERVAL", "5"))
+
+# Distinct values kept per signal; enough to exceed any sensible threshold
+MAX_TRACKED_VALUES = 32
+
+OBSERVED_TYPES = {ActivityType.LOGIN.value, ActivityType.REPORT_VIEW.value}
+
+def network_of(ip_address: str) -> str:
+    """Coarse network an address belongs to: /16 for IPv4 (including
+    IPv4-mapped IPv6), /64 for IPv6, "unknown" if it does not parse.
+    Hops inside one network (DHCP, mobile carriers) are not switches."""
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return "unknown"
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    prefix = 16 if address.version == 4 else 64
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+class UserWindow:
+    """Compact per-user state: last-seen times of recent IPs and user agents,
+    view token expiries and recent network switches, all pruned to the window"""
+
+    __slots__ = ("email", "ips", "agents", "tokens", "switches", "last_network", "last_seen", "flagged")
+
+    def __init__(self, email: Optional[str]):
+        self.email = email
+        # Insertion order is last-seen order, so pruning only touches the front
+        self.ips: "OrderedDict[str, datetime]" = OrderedDict()
+        self.agents: "OrderedDict[str, datetime]" = OrderedDict()
+        self.tokens: Deque[datetime] = deque()
+        self.switches: Deque[Dict[str, Any]] = deque()
+        self.last_network: Optional[str] = None
+        self.last_seen: Optional[datetime] = None
+        self.flagged: frozenset = frozenset()
+
+def _touch(values: "OrderedDict[str, datetime]", key: str, timestamp: datetime):
+    values[key] = timestamp
+    values.move_to_end(key)
+    if len(values) > MAX_TRACKED_VALUES:
+        values.popitem(last=False)
+
+def _prune(values: "OrderedDict[str, datetime]", cutoff: datetime):
+    while values:
+        key, seen = next(iter(values.items()))
+        if seen >= cutoff:
+            break
+        values.popitem(last=False)
+
+class SharingDetector:
+    """Flags accounts that look shared, updated incrementally from login and
+    report view events as the activity sink writes them.
+
+    State is per process; flags are persisted to db.sharing_flags so every
+    worker's findings end up in one place.
+    """
+
+    def __init__(self, max_users: int, flush_interval: float):
+        self.max_users = max(1, max_users)
+        self.flush_interval = flush_interval
+        self._users: "OrderedDict[str, UserWindow]" = OrderedDict()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self.observed = 0
+        self.flags_raised = 0
+        self.evicted = 0
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher after writing any pending flags"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    def _window(self, user_id: str, email: Optional[str]) -> UserWindow:
+        window = self._users.get(user_id)
+        if window is None:
+            window = UserWindow(email)
+            self._users[user_id] = window
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._users.move_to_end(user_id)
+        return window
+
+    def observe(self, activity: Dict[str, Any]):
+        """Fold one activity log document into its user's window"""
+        if activity["activity_type"] not in OBSERVED_TYPES or not activity.get("user_id"):
+            return
+        self.observed += 1
+        timestamp = activity["timestamp"]
+        window = self._window(activity["user_id"], activity.get("user_email"))
+
+        ip_address = activity.get("ip_address")
+        if ip_address:
+            _touch(window.ips, ip_address, timestamp)
+            network = network_of(ip_address)
+            if (window.last_network is not None and network != window.last_network
+                    and timestamp - window.last_seen < SHARING_SWITCH_INTERVAL):
+                window.switches.append({"from": window.last_network, "to": network, "at": timestamp})
+            window.last_network = network
+            window.last_seen = timestamp
+        user_agent = activity.get("user_agent")
+        if user_agent:
+            _touch(window.agents, user_agent, timestamp)
+
+        self._evaluate(activity["user_id"], window, timestamp)
+
+    def observe_token(self, user_id: str, email: Optional[str], issued_at: datetime, expiry: datetime):
+        """Record a view token issued to user_id"""
+        window = self._window(user_id, email)
+        window.tokens.append(expiry)
+        self._evaluate(user_id, window, issued_at)
+
+    def _evaluate(self, user_id: str, window: UserWindow, now: datetime):
+        cutoff = now - SHARING_WINDOW
+        _prune(window.ips, cutoff)
+        _prune(window.agents, cutoff)
+        while window.switches and window.switches[0]["at"] < cutoff:
+            window.switches.popleft()
+        # Tokens are issued in time order with a fixed TTL, so expiries are sorted
+        while window.tokens and window.tokens[0] <= now:
+            window.tokens.popleft()
+
+        reasons = []
+        if len(window.ips) > SHARING_MAX_IPS:
+            reasons.append("distinct_ips")
+        if len(window.agents) > SHARING_MAX_USER_AGENTS:
+            reasons.append("distinct_user_agents")
+        if len(window.tokens) > SHARING_MAX_CONCURRENT_TOKENS:
+            reasons.append("concurrent_view_tokens")
+        if len(window.switches) > SHARING_MAX_IP_SWITCHES:
+            reasons.append("ip_switches")
+
+        flagged = frozenset(reasons)
+        if flagged and flagged != window.flagged:
+            self.flags_raised += 1
+        window.flagged = flagged
+        if not flagged:
+            return
+
+        # Coalesced per user until the next flush; the latest evidence wins
+        self._pending[user_id] = {
+            "id": user_id,
+            "user_email": window.email,
+            "reasons": reasons,
+            "evidence": {
+                "ip_addresses": list(window.ips),
+                "user_agents": list(window.agents),
+                "concurrent_view_tokens": len(window.tokens),
+                "ip_switches": list(window.switches),
+            },
+            "last_flagged_at": now,
+        }
+
+    async def flush(self) -> int:
+        """Persist flags raised since the last flush"""
+        if not self._pending or self._db is None:
+            return 0
+        pending, self._pending = self._pending, {}
+        requests = [
+            UpdateOne(
+                {"id": user_id},
+                {"$set": flag, "$setOnInsert": {"first_flagged_at": flag["last_flagged_at"]}, "$inc": {"hits": 1}},
+                upsert=True
+            )
+            for user_id, flag in pending.items()
+        ]
+        try:
+            await self._db.sharing_flags.bulk_write(requests, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to write sharing flags: {str(e)}")
+            return 0
+        return len(requests)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_users": len(self._users),
+            "observed": self.observed,
+            "flags_raised": self.flags_raised,
+            "pending": len(self._pending),
+            "evicted": self.evicted,
+        }
+
+# Shared detector fed by the activity sink and started by the server lifespan
+sharing_detector = SharingDetector(SHARING_MAX_USERS, SHARING_FLUSH_INTERVAL)
@@ -0,0 +1,97 @@
+"""
+Query-plan checks for the activity log API.
+Runs against the MongoDB at MONGO_URL in a scratch database; skipped when none is reachable.
+"""
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+from itertools import combinations
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+import database
+from pagination import encode_cursor, keyset_query, keyset_sort
+from utils import activity_log_filter
+
+FILTER_VALUES = {
+    "user_id": "user-1",
+    "activity_type": "report_view",
+    "ip_address": "10.0.0.1",
+    "report_id": "report-1",
+}
+
+
+@pytest.fixture(scope="module")
+def activity_logs():
+    client = MongoClient(database.MONGO_URL, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip("MongoDB not reachable")
+
+    db_name = f"explain_test_{uuid.uuid4().hex[:8]}"
+
+    async def create_indexes():
+        database.client = database.AsyncIOMotorClient(database.MONGO_URL)
+        database.database = database.client[db_name]
+        await database.create_indexes()
+        database.client.close()
+
+    asyncio.run(create_indexes())
+    collection = client[db_name].activity_logs
+    now = datetime.utcnow()
+    collection.insert_many([{
+        "id": str(uuid.uuid4()),
+        "user_id": f"user-{i % 10}",
+        "activity_type": ["report_view", "login", "failed_login"][i % 3],
+        "ip_address": f"10.0.0.{i % 7}",
+        "metadata": {"report_id": f"report-{i % 5}"},
+        "timestamp": now - timedelta(minutes=i),
+    } for i in range(500)])
+
+    yield collection
+    client.drop_database(db_name)
+    client.close()
+
+
+def plan_stages(plan):
+    """All stage names in a winning plan tree"""
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+
+def filter_combinations():
+    names = list(FILTER_VALUES)
+    for size in range(len(names) + 1):
+        for combo in combinations(names, size):
+            yield {name: FILTER_VALUES[name] for name in combo}
+
+
+@pytest.mark.parametrize("filters", list(filter_combinations()), ids=lambda f: "+".join(f) or "none")
+@pytest.mark.parametrize("windowed", [False, True])
+@pytest.mark.parametrize("paged", [False, True])
+def test_activity_log_queries_use_indexes(activity_logs, filters, windowed, paged):
+    """Every filter combination should use an index for both filter and sort"""
+    now = datetime.utcnow()
+    window = {"since": now - timedelta(days=1), "until": now} if windowed else {}
+    cursor = encode_cursor({"timestamp": now - timedelta(hours=1), "id": "x"}, "timestamp") if paged else None
+
+    query = keyset_query(activity_log_filter(**filters, **window), cursor, "timestamp")
+    explain = activity_logs.find(query).sort(keyset_sort("timestamp")).limit(101).explain()
+    stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+
+    assert "COLLSCAN" not in stages, stages
+    assert "SORT" not in stages, stages
+    print(f"✓ {'+'.join(filters) or 'no filters'}: {' <- '.join(s for s in stages if s)}")
@@ -0,0 +1,81 @@
+"""
+Activity rollup backfill against the MongoDB at MONGO_URL in a scratch
+database; skipped when none is reachable.
+"""
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+import database
+from rollups import activity_rollups
+
+DAY = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def db_name():
+    client = MongoClient(database.MONGO_URL, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip("MongoDB not reachable")
+
+    name = f"rollup_test_{uuid.uuid4().hex[:8]}"
+    yield name
+    client.drop_database(name)
+    client.close()
+
+
+def run_backfill(db_name, activities):
+    async def backfill():
+        database.client = database.AsyncIOMotorClient(database.MONGO_URL)
+        database.database = database.client[db_name]
+        try:
+            await database.create_indexes()
+            await database.database.activity_logs.insert_many(activities)
+            await activity_rollups.backfill(database.database, DAY, None)
+            # A second run replaces the counts instead of adding to them
+            await activity_rollups.backfill(database.database, DAY, None)
+            return (
+                await database.database.activity_rollups.find({"granularity": "day"}, {"_id": 0}).to_list(length=None),
+                await database.database.ip_rollups.find({"granularity": "day"}, {"_id": 0}).to_list(length=None),
+            )
+        finally:
+            database.client.close()
+
+    return asyncio.run(backfill())
+
+
+def test_backfill_rolls_up_logins_without_report_or_company(db_name):
+    report_rollups, ip_rollups = run_backfill(db_name, [
+        # Written before company_id was recorded, and with no report
+        {"id": "log-1", "user_id": "user-1", "activity_type": "login",
+         "ip_address": "10.0.0.1", "metadata": {}, "timestamp": DAY.replace(hour=9)},
+        {"id": "log-2", "user_id": "user-1", "activity_type": "failed_login",
+         "ip_address": "10.0.0.1", "metadata": {"attempts": 4}, "timestamp": DAY.replace(hour=9)},
+        {"id": "log-3", "user_id": "user-1", "activity_type": "report_view", "company_id": "company-1",
+         "ip_address": "10.0.0.1", "metadata": {"report_id": "report-1"}, "timestamp": DAY.replace(hour=10)},
+        {"id": "log-4", "user_id": "user-2", "activity_type": "report_view", "company_id": "company-1",
+         "ip_address": None, "metadata": {"report_id": "report-1"}, "timestamp": DAY.replace(hour=11)},
+    ])
+
+    counts = {(row["company_id"], row["report_id"], row["activity_type"]): row["count"] for row in report_rollups}
+    assert counts == {
+        (None, None, "login"): 1,
+        (None, None, "failed_login"): 4,
+        ("company-1", "report-1", "report_view"): 2,
+    }
+    assert {(row["ip_address"], row["activity_type"]): row["count"] for row in ip_rollups} == {
+        ("10.0.0.1", "login"): 1,
+        ("10.0.0.1", "failed_login"): 4,
+        ("10.0.0.1", "report_view"): 1,
+    }
@@ -217,6 +217,47 @@ class TestAdminDashboard:
         print(f"✓ Got {len(data)} activity logs")
 
 
+    def test_get_metrics(self):
+        """Admin should get password hashing pool metrics"""
+        response = requests.get(f"{BASE_URL}/api/admin/metrics", headers=self.headers)
+        assert response.status_code == 200
+        data = response.json()
+        
+        hashing = data["password_hashing"]
+        assert hashing["workers"] >= 1
+        assert "queue_depth" in hashing
+        assert "p99" in hashing["run_ms"]
+        
+        print(f"✓ Hash pool: {hashing['workers']} workers, {hashing['completed']} jobs completed")
+
+    def test_get_unknown_ingestion_job(self):
+        """Unknown ingestion job ids should return 404"""
+        response = requests.get(f"{BASE_URL}/api/admin/jobs/does-not-exist", headers=self.headers)
+        assert response.status_code == 404
+        print("✓ Unknown ingestion job correctly returns 404")
+
+    def test_update_unknown_report(self):
+        """Updating or deleting an unknown report should return 404"""
+        response = requests.put(f"{BASE_URL}/api/admin/reports/does-not-exist",
+                                json={"status": "archived"}, headers=self.headers)
+        assert response.status_code == 404
+        response = requests.delete(f"{BASE_URL}/api/admin/reports/does-not-exist", headers=self.headers)
+        assert response.status_code == 404
+        print("✓ Unknown report update/delete correctly returns 404")
+
+    def test_get_sharing_flags(self):
+        """Admin should get flagged accounts with their evidence"""
+        response = requests.get(f"{BASE_URL}/api/admin/sharing-flags", headers=self.headers)
+        assert response.status_code == 200
+        data = response.json()
+
+        assert isinstance(data, list)
+        for flag in data:
+            assert flag["reasons"]
+            assert "ip_addresses" in flag["evidence"]
+
+        print(f"✓ Got {len(data)} flagged accounts")
+
 class TestAdminCompanyManagement:
     """Admin company management tests"""
     
@@ -263,6 +304,24 @@ class TestAdminCompanyManagement:
         
         print(f"✓ Created and verified company: {test_company_name}")
 
+    def test_companies_pagination(self):
+        """Company pages should chain through X-Next-Cursor without repeats"""
+        seen = []
+        params = {"limit": 1, "fields": "name"}
+        for _ in range(3):
+            response = requests.get(f"{BASE_URL}/api/admin/companies", headers=self.headers, params=params)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 1
+            seen.extend(c["id"] for c in page)
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            params["cursor"] = cursor
+        
+        assert len(seen) == len(set(seen))
+        print(f"✓ Paged through {len(seen)} companies")
+
     def test_create_duplicate_company_fails(self):
         """Creating duplicate company should fail"""
         response = requests.post(
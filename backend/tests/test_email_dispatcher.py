@@ -0,0 +1,91 @@
+"""
+EmailDispatcher behaviour against the in-memory FakeTransport: retries,
+rate limiting and per-recipient results. No network or database needed.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import resend
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_service import EmailDispatcher, FakeTransport
+
+def _messages(count):
+    return [{"to": f"user{i}@example.com", "subject": "Hola", "html": "<p>Hola</p>"} for i in range(count)]
+
+def _dispatcher(transport, rate=0, max_retries=3, concurrency=4):
+    return EmailDispatcher(transport, concurrency, rate, max_retries, backoff=0, batch_size=100)
+
+def test_transient_failures_are_retried():
+    transport = FakeTransport(supports_batch=False, failures=2)
+    results = asyncio.run(_dispatcher(transport).send_many(_messages(1)))
+
+    assert results[0]["status"] == "success"
+    assert results[0]["attempts"] == 3
+    assert transport.calls == 3
+
+def test_retries_stop_after_max_retries():
+    transport = FakeTransport(supports_batch=False, failures=10)
+    results = asyncio.run(_dispatcher(transport, max_retries=2).send_many(_messages(1)))
+
+    assert results[0]["status"] == "error"
+    assert results[0]["attempts"] == 3
+    assert transport.calls == 3
+
+def test_server_errors_are_retried_but_bad_requests_are_not():
+    rate_limited = resend.exceptions.RateLimitError("Too many requests", "rate_limit_exceeded", "429")
+    transport = FakeTransport(supports_batch=False, failures=1, error=rate_limited)
+    assert asyncio.run(_dispatcher(transport).send_many(_messages(1)))[0]["status"] == "success"
+    assert transport.calls == 2
+
+    invalid = resend.exceptions.ValidationError("Invalid `to` field", "validation_error", "422")
+    transport = FakeTransport(supports_batch=False, failures=1, error=invalid)
+    results = asyncio.run(_dispatcher(transport).send_many(_messages(1)))
+    assert results[0]["status"] == "error"
+    assert transport.calls == 1
+
+def test_programming_errors_are_not_retried():
+    transport = FakeTransport(supports_batch=False, failures=1, error=TypeError("unexpected keyword"))
+    results = asyncio.run(_dispatcher(transport).send_many(_messages(1)))
+
+    assert results[0]["status"] == "error"
+    assert results[0]["attempts"] == 1
+    assert transport.calls == 1
+
+def test_rate_limit_spaces_requests():
+    transport = FakeTransport(supports_batch=False)
+    # The bucket allows a burst of `rate` requests, then `rate` per second
+    started = time.monotonic()
+    results = asyncio.run(_dispatcher(transport, rate=20).send_many(_messages(30)))
+    elapsed = time.monotonic() - started
+
+    assert all(result["status"] == "success" for result in results)
+    assert elapsed >= 0.4
+
+def test_one_result_per_recipient_in_order():
+    transport = FakeTransport(supports_batch=False, failures=1)
+    messages = _messages(5)
+    results = asyncio.run(_dispatcher(transport, max_retries=0, concurrency=1).send_many(messages))
+
+    assert [result["email"] for result in results] == [m["to"] for m in messages]
+    assert [result["status"] for result in results] == ["error"] + ["success"] * 4
+
+def test_batches_report_each_recipient():
+    transport = FakeTransport(supports_batch=True)
+    dispatcher = EmailDispatcher(transport, 4, 0, 3, backoff=0, batch_size=2)
+    results = asyncio.run(dispatcher.send_many(_messages(5)))
+
+    assert transport.calls == 3
+    assert [result["email"] for result in results] == [f"user{i}@example.com" for i in range(5)]
+    assert len({result["email_id"] for result in results}) == 5
+
+def test_unconfigured_transport_skips_everyone():
+    transport = FakeTransport()
+    transport.configured = False
+    results = asyncio.run(_dispatcher(transport).send_many(_messages(3)))
+
+    assert [result["status"] for result in results] == ["skipped"] * 3
+    assert transport.calls == 0
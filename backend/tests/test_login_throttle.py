@@ -0,0 +1,163 @@
+"""
+Login throttle window arithmetic and failed-login coalescing, with the
+clock and log_activity patched. No database needed.
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import login_throttle
+from login_throttle import FailedLoginLog, MemoryLoginThrottle, sliding_count
+
+EMAIL = "owner@example.com"
+IP = "203.0.113.7"
+WINDOW = 100
+
+def _at(monkeypatch, now):
+    monkeypatch.setattr(login_throttle.time, "time", lambda: now)
+
+def _fail(monkeypatch, throttle, now, times, ip_address=IP, email=EMAIL):
+    _at(monkeypatch, now)
+    for _ in range(times):
+        asyncio.run(throttle.record_failure(ip_address, email))
+
+def _retry_after(monkeypatch, throttle, now, ip_address=IP, email=EMAIL):
+    _at(monkeypatch, now)
+    return asyncio.run(throttle.retry_after(ip_address, email))
+
+def test_sliding_count_weights_previous_window_by_remaining_overlap():
+    assert sliding_count(10, 2, 0, WINDOW) == 12
+    assert sliding_count(10, 2, WINDOW / 2, WINDOW) == 7
+    assert sliding_count(10, 2, WINDOW, WINDOW) == 2
+
+def test_account_limit_holds_until_failures_slide_out(monkeypatch):
+    throttle = MemoryLoginThrottle(WINDOW, 100)
+    limit = login_throttle.LOGIN_MAX_FAILURES_PER_EMAIL
+    _fail(monkeypatch, throttle, 1000, limit - 1)
+    assert _retry_after(monkeypatch, throttle, 1000) is None
+
+    _fail(monkeypatch, throttle, 1000, 1)
+    assert _retry_after(monkeypatch, throttle, 1000) == WINDOW
+    assert _retry_after(monkeypatch, throttle, 1099.5) == 1
+    # At the start of the next window the previous one still counts in full
+    assert _retry_after(monkeypatch, throttle, 1100) == WINDOW
+    # Halfway through, half of it has slid out
+    assert _retry_after(monkeypatch, throttle, 1150) is None
+    assert _retry_after(monkeypatch, throttle, 1200) is None
+    assert throttle.stats()["rejected"] == 3
+
+def test_account_limit_is_per_ip(monkeypatch):
+    throttle = MemoryLoginThrottle(WINDOW, 100)
+    _fail(monkeypatch, throttle, 1000, login_throttle.LOGIN_MAX_FAILURES_PER_EMAIL)
+
+    assert _retry_after(monkeypatch, throttle, 1000) is not None
+    assert _retry_after(monkeypatch, throttle, 1000, email=EMAIL.upper()) is not None
+    assert _retry_after(monkeypatch, throttle, 1000, ip_address="198.51.100.1") is None
+
+def test_account_wide_limit_spans_ips(monkeypatch):
+    throttle = MemoryLoginThrottle(WINDOW, 1000)
+    limit = login_throttle.LOGIN_MAX_FAILURES_PER_ACCOUNT
+    per_ip = login_throttle.LOGIN_MAX_FAILURES_PER_EMAIL - 1
+    _at(monkeypatch, 1000)
+    # Each address stays under its own (email, IP) limit
+    for i in range(limit):
+        asyncio.run(throttle.record_failure(f"198.51.100.{i // per_ip}", EMAIL))
+
+    assert _retry_after(monkeypatch, throttle, 1000, ip_address="192.0.2.1") is not None
+    assert _retry_after(monkeypatch, throttle, 1000, ip_address="192.0.2.1", email="other@example.com") is None
+
+    asyncio.run(throttle.reset("192.0.2.1", EMAIL))
+    assert _retry_after(monkeypatch, throttle, 1000, ip_address="192.0.2.1") is None
+
+def test_ip_limit_spans_accounts(monkeypatch):
+    throttle = MemoryLoginThrottle(WINDOW, 1000)
+    _at(monkeypatch, 1000)
+    for i in range(login_throttle.LOGIN_MAX_FAILURES_PER_IP):
+        asyncio.run(throttle.record_failure(IP, f"user{i}@example.com"))
+
+    assert _retry_after(monkeypatch, throttle, 1000, email="fresh@example.com") is not None
+    assert _retry_after(monkeypatch, throttle, 1000, ip_address="198.51.100.1", email="fresh@example.com") is None
+
+def test_reset_clears_the_account_but_not_the_ip(monkeypatch):
+    throttle = MemoryLoginThrottle(WINDOW, 1000)
+    _fail(monkeypatch, throttle, 1000, login_throttle.LOGIN_MAX_FAILURES_PER_EMAIL)
+    _at(monkeypatch, 1000)
+    for i in range(login_throttle.LOGIN_MAX_FAILURES_PER_IP):
+        asyncio.run(throttle.record_failure(IP, f"user{i}@example.com"))
+
+    asyncio.run(throttle.reset(IP, EMAIL))
+    assert _retry_after(monkeypatch, throttle, 1000, ip_address="198.51.100.1") is None
+    assert _retry_after(monkeypatch, throttle, 1000) is not None
+
+def test_least_recently_failed_keys_are_evicted(monkeypatch):
+    throttle = MemoryLoginThrottle(WINDOW, 2)
+    _fail(monkeypatch, throttle, 1000, 1, ip_address=None, email="a@example.com")
+    _fail(monkeypatch, throttle, 1000, 1, ip_address=None, email="b@example.com")
+    _fail(monkeypatch, throttle, 1000, 1, ip_address=None, email="c@example.com")
+    assert throttle.stats()["keys"] == 2
+    assert throttle.stats()["evicted"] == 1
+
+def _summaries(monkeypatch, attempts):
+    """Record attempts as (email, ip, reason, user) on a running log and
+    return the activity entries written when it stops"""
+    written = []
+
+    async def fake_log_activity(db, user_id, user_email, activity_type, description, ip_address, **kwargs):
+        written.append({"user_id": user_id, "email": user_email, "ip_address": ip_address, **kwargs["metadata"]})
+
+    monkeypatch.setattr(login_throttle, "log_activity", fake_log_activity)
+
+    async def run():
+        log = FailedLoginLog(interval=3600, max_keys=100)
+        log.start(object())
+        for email, ip_address, reason, user in attempts:
+            await log.record(None, email, ip_address, reason, user)
+        await log.stop()
+        return log
+
+    log = asyncio.run(run())
+    assert log.stats()["attempts"] == len(attempts)
+    return written
+
+def test_failures_for_one_account_and_ip_are_coalesced(monkeypatch):
+    user = {"id": "user-1", "company_id": "company-1"}
+    written = _summaries(monkeypatch, [
+        (EMAIL, IP, "invalid password", user),
+        (EMAIL.upper(), IP, "invalid password", user),
+        (EMAIL, IP, "user inactive", user),
+        (EMAIL, "198.51.100.1", "invalid password", user),
+    ])
+
+    assert len(written) == 2
+    first = next(entry for entry in written if entry["ip_address"] == IP)
+    assert first["user_id"] == "user-1"
+    assert first["attempts"] == 3
+    assert first["reasons"] == {"invalid password": 2, "user inactive": 1}
+
+def test_unknown_accounts_are_folded_per_ip(monkeypatch):
+    samples = login_throttle.FAILED_LOGIN_EMAIL_SAMPLES
+    written = _summaries(monkeypatch, [
+        (f"probe{i}@example.com", IP, "user not found", None) for i in range(samples + 5)
+    ])
+
+    assert len(written) == 1
+    assert written[0]["email"] is None
+    assert written[0]["attempts"] == samples + 5
+    assert len(written[0]["sample_emails"]) == samples
+
+def test_throttled_attempts_stay_with_their_account(monkeypatch):
+    user = {"id": "user-1", "company_id": "company-1"}
+    written = _summaries(monkeypatch, [
+        (EMAIL, IP, "throttled", None),
+        (EMAIL, IP, "invalid password", user),
+        ("probe@example.com", IP, "user not found", None),
+    ])
+
+    assert len(written) == 2
+    account = next(entry for entry in written if entry["email"] is not None)
+    assert account["user_id"] == "user-1"
+    assert account["reasons"] == {"throttled": 1, "invalid password": 1}
+    unknown = next(entry for entry in written if entry["email"] is None)
+    assert unknown["sample_emails"] == ["probe@example.com"]
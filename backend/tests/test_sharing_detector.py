@@ -0,0 +1,112 @@
+"""
+SharingDetector thresholds and window pruning, fed synthetic activity
+documents directly. No database needed.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sharing
+from sharing import SharingDetector, network_of
+
+START = datetime(2026, 1, 1)
+
+def _activity(ip_address="10.0.0.1", user_agent="agent-0", at=START, activity_type="report_view", user_id="user-1"):
+    return {
+        "user_id": user_id,
+        "user_email": f"{user_id}@example.com",
+        "activity_type": activity_type,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "timestamp": at,
+    }
+
+def _reasons(detector, user_id="user-1"):
+    flag = detector._pending.get(user_id)
+    return flag["reasons"] if flag else []
+
+def test_network_of_groups_addresses_by_prefix():
+    assert network_of("10.1.2.3") == network_of("10.1.200.7") == "10.1.0.0/16"
+    assert network_of("10.2.2.3") != network_of("10.1.2.3")
+    assert network_of("2001:db8::1") == network_of("2001:db8:0:0:ffff::2") == "2001:db8::/64"
+    assert network_of("::ffff:10.1.9.9") == "10.1.0.0/16"
+    assert network_of("not an address") == "unknown"
+
+def test_distinct_ips_above_limit_flag_the_account():
+    detector = SharingDetector(max_users=10, flush_interval=0)
+    for i in range(sharing.SHARING_MAX_IPS):
+        detector.observe(_activity(ip_address=f"10.0.0.{i + 1}", at=START + timedelta(hours=i)))
+    assert _reasons(detector) == []
+
+    detector.observe(_activity(ip_address="10.0.0.99", at=START + timedelta(hours=5)))
+    assert _reasons(detector) == ["distinct_ips"]
+
+def test_distinct_user_agents_above_limit_flag_the_account():
+    detector = SharingDetector(max_users=10, flush_interval=0)
+    for i in range(sharing.SHARING_MAX_USER_AGENTS + 1):
+        detector.observe(_activity(user_agent=f"agent-{i}", at=START + timedelta(hours=i)))
+    assert _reasons(detector) == ["distinct_user_agents"]
+
+def test_concurrent_view_tokens_above_limit_flag_the_account():
+    detector = SharingDetector(max_users=10, flush_interval=0)
+    for i in range(sharing.SHARING_MAX_CONCURRENT_TOKENS):
+        issued = START + timedelta(seconds=i)
+        detector.observe_token("user-1", "user-1@example.com", issued, issued + timedelta(minutes=5))
+    assert _reasons(detector) == []
+
+    issued = START + timedelta(seconds=10)
+    detector.observe_token("user-1", "user-1@example.com", issued, issued + timedelta(minutes=5))
+    assert _reasons(detector) == ["concurrent_view_tokens"]
+
+def test_expired_view_tokens_are_not_concurrent():
+    detector = SharingDetector(max_users=10, flush_interval=0)
+    for i in range(sharing.SHARING_MAX_CONCURRENT_TOKENS + 1):
+        issued = START + timedelta(minutes=10 * i)
+        detector.observe_token("user-1", "user-1@example.com", issued, issued + timedelta(minutes=5))
+    assert _reasons(detector) == []
+
+def test_fast_network_switches_flag_the_account():
+    detector = SharingDetector(max_users=10, flush_interval=0)
+    # Two alternating networks a minute apart, so every event after the first is a switch
+    for i in range(sharing.SHARING_MAX_IP_SWITCHES + 2):
+        network = "10.1" if i % 2 == 0 else "10.2"
+        detector.observe(_activity(ip_address=f"{network}.0.1", at=START + timedelta(minutes=i)))
+    assert _reasons(detector) == ["ip_switches"]
+
+def test_slow_network_changes_and_hops_inside_a_network_are_not_switches():
+    detector = SharingDetector(max_users=10, flush_interval=0)
+    interval = sharing.SHARING_SWITCH_INTERVAL + timedelta(seconds=1)
+    for i in range(sharing.SHARING_MAX_IP_SWITCHES + 2):
+        network = "10.1" if i % 2 == 0 else "10.2"
+        detector.observe(_activity(ip_address=f"{network}.0.1", at=START + i * interval))
+    # Addresses differ only below the /16, so they are one network
+    for i in range(sharing.SHARING_MAX_IP_SWITCHES + 2):
+        detector.observe(_activity(user_id="user-2", ip_address=f"10.3.{i}.1", at=START + timedelta(seconds=i)))
+    assert _reasons(detector) == []
+    assert not detector._users["user-2"].switches
+
+def test_signals_older_than_the_window_are_pruned():
+    detector = SharingDetector(max_users=10, flush_interval=0)
+    for i in range(sharing.SHARING_MAX_IPS):
+        detector.observe(_activity(ip_address=f"10.0.0.{i + 1}", at=START))
+    later = START + sharing.SHARING_WINDOW + timedelta(seconds=1)
+    detector.observe(_activity(ip_address="10.0.0.99", at=later))
+
+    assert _reasons(detector) == []
+    assert list(detector._users["user-1"].ips) == ["10.0.0.99"]
+
+def test_unobserved_activity_and_anonymous_events_are_ignored():
+    detector = SharingDetector(max_users=10, flush_interval=0)
+    detector.observe(_activity(activity_type="report_download"))
+    detector.observe(_activity(user_id=None))
+    assert detector.stats()["observed"] == 0
+    assert detector.stats()["tracked_users"] == 0
+
+def test_least_recently_active_users_are_evicted():
+    detector = SharingDetector(max_users=2, flush_interval=0)
+    for user_id in ("user-1", "user-2", "user-1", "user-3"):
+        detector.observe(_activity(user_id=user_id))
+    assert list(detector._users) == ["user-1", "user-3"]
+    assert detector.stats()["evicted"] == 1
@@ -0,0 +1,281 @@
+import asyncio
+import hashlib
+import logging
+import os
+import unicodedata
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+
+from utils import format_file_size
+from file_serving import guess_content_type, COMPRESSIBLE_TYPES, ENCODING_SUFFIXES
+from report_cache import manifest_key
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip siblings are produced
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Size of each chunk copied from the multipart spool to disk
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Per-file and per-request upload quotas in bytes
+MAX_UPLOAD_FILE_SIZE = int(os.environ.get("MAX_UPLOAD_FILE_SIZE", str(1024 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_SIZE = int(os.environ.get("MAX_UPLOAD_REQUEST_SIZE", str(2 * 1024 * 1024 * 1024)))
+
+# Zip-bomb guards applied while extracting report archives
+MAX_ZIP_MEMBERS = int(os.environ.get("MAX_ZIP_MEMBERS", "10000"))
+MAX_ZIP_UNCOMPRESSED_SIZE = int(os.environ.get("MAX_ZIP_UNCOMPRESSED_SIZE", str(5 * 1024 * 1024 * 1024)))
+ZIP_EXTRACT_WORKERS = int(os.environ.get("ZIP_EXTRACT_WORKERS", "2"))
+
+# Assets smaller than this are not worth precompressing
+PRECOMPRESS_MIN_SIZE = int(os.environ.get("PRECOMPRESS_MIN_SIZE", "1024"))
+# A compressed sibling is kept only if it is at most this fraction of the original
+PRECOMPRESS_MAX_RATIO = float(os.environ.get("PRECOMPRESS_MAX_RATIO", "0.9"))
+
+extraction_executor = ThreadPoolExecutor(max_workers=ZIP_EXTRACT_WORKERS, thread_name_prefix="zip-extract")
+
+class ArchiveRejected(Exception):
+    """Raised when an archive exceeds the extraction limits"""
+
+async def save_upload_stream(upload: UploadFile, destination: Path, request_quota: int) -> Tuple[int, str]:
+    """Copy an upload to disk in fixed-size chunks, returning (size, sha256).
+
+    Only one chunk is held in memory at a time. The partial file is removed
+    if the upload exceeds the per-file limit or the remaining request quota.
+    """
+    limit = min(MAX_UPLOAD_FILE_SIZE, request_quota)
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(destination, 'wb') as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    if size > MAX_UPLOAD_FILE_SIZE:
+                        detail = f"File {upload.filename} exceeds the {format_file_size(MAX_UPLOAD_FILE_SIZE)} limit"
+                    else:
+                        detail = f"Upload exceeds the {format_file_size(MAX_UPLOAD_REQUEST_SIZE)} request limit"
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=detail
+                    )
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+
+    return size, digest.hexdigest()
+
+def is_metadata_member(name: str) -> bool:
+    """True for macOS resource-fork entries that should never be extracted"""
+    parts = name.split('/')
+    return '__MACOSX' in parts or parts[-1].startswith('._')
+
+def extract_archive(
+    zip_path: Path,
+    target_dir: Path,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> List[Dict[str, Any]]:
+    """Extract a ZIP member by member and return manifest entries.
+
+    Each entry has the written path, size, mtime and SHA-256, computed while
+    streaming so no directory walk or re-read is needed afterwards. Runs in a
+    worker thread; progress(done, total) is called after each member.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        # Count every entry, including skipped metadata, against the limit
+        entries = zip_ref.infolist()
+        if len(entries) > MAX_ZIP_MEMBERS:
+            raise ArchiveRejected(f"Archive has {len(entries)} entries, limit is {MAX_ZIP_MEMBERS}")
+        members = [
+            m for m in entries
+            if not m.is_dir() and not is_metadata_member(m.filename)
+        ]
+
+        declared_size = sum(m.file_size for m in members)
+        if declared_size > MAX_ZIP_UNCOMPRESSED_SIZE:
+            raise ArchiveRejected(
+                f"Archive expands to {format_file_size(declared_size)}, "
+                f"limit is {format_file_size(MAX_ZIP_UNCOMPRESSED_SIZE)}"
+            )
+
+        target_root = target_dir.resolve()
+        extracted = []
+        created: List[Path] = []
+        written = 0
+        try:
+            for index, member in enumerate(members, start=1):
+                # Store names in NFC so macOS (NFD) archives match what browsers request
+                destination = target_dir / unicodedata.normalize('NFC', member.filename)
+                resolved = destination.resolve()
+                if not resolved.is_relative_to(target_root) or resolved == target_root:
+                    logger.warning(f"Skipping unsafe archive member: {member.filename}")
+                    if progress:
+                        progress(index, len(members))
+                    continue
+
+                missing = [p for p in reversed(destination.parents) if p.is_relative_to(target_dir) and not p.exists()]
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                created.extend(missing)
+                created.append(destination)
+                digest = hashlib.sha256()
+                size = 0
+                with zip_ref.open(member) as src, open(destination, 'wb') as dst:
+                    while True:
+                        chunk = src.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        # Headers can lie about sizes, so count real output too
+                        written += len(chunk)
+                        if written > MAX_ZIP_UNCOMPRESSED_SIZE:
+                            raise ArchiveRejected(
+                                f"Archive expands beyond {format_file_size(MAX_ZIP_UNCOMPRESSED_SIZE)}"
+                            )
+                        size += len(chunk)
+                        digest.update(chunk)
+                        dst.write(chunk)
+
+                extracted.append({
+                    "path": destination,
+                    "size": size,
+                    "mtime": destination.stat().st_mtime,
+                    "sha256": digest.hexdigest(),
+                })
+                if progress:
+                    progress(index, len(members))
+        except BaseException:
+            # Undo a partial extraction: the members written so far and the directories made for them
+            for path in reversed(created):
+                try:
+                    path.rmdir() if path.is_dir() else path.unlink(missing_ok=True)
+                except OSError:
+                    pass
+            raise
+
+    return extracted
+
+async def extract_archive_async(
+    zip_path: Path,
+    target_dir: Path,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> List[Dict[str, Any]]:
+    """Run extract_archive on the extraction pool without blocking the event loop.
+
+    The progress callback, if given, is invoked on the event loop thread.
+    """
+    loop = asyncio.get_running_loop()
+    report = None
+    if progress:
+        def report(done: int, total: int):
+            loop.call_soon_threadsafe(progress, done, total)
+
+    return await loop.run_in_executor(
+        extraction_executor, extract_archive, zip_path, target_dir, report
+    )
+
+def build_report_manifest(main_file: str, files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Index of the files under the report's directory, keyed by their NFC path
+    relative to it, with the size, mtime, content type and content hash used
+    to serve them without touching the filesystem."""
+    report_dir = PurePosixPath(main_file).parent
+    manifest = []
+    for f in files:
+        path = PurePosixPath(f["path"])
+        if not path.is_relative_to(report_dir):
+            continue
+        relative = str(path.relative_to(report_dir))
+        manifest.append({
+            "key": manifest_key(relative),
+            "path": relative,
+            "size": f["size"],
+            "mtime": f["mtime"],
+            "content_type": guess_content_type(path),
+            "sha256": f["sha256"],
+        })
+    return manifest
+
+class _GzipCompressor:
+    """gzip stream compressor with the same process/finish API as brotli's"""
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+def _compressors() -> Dict[str, Callable[[], Any]]:
+    """Streaming compressor factories for each encoding available here"""
+    compressors = {"gzip": _GzipCompressor}
+    if brotli is not None:
+        compressors["br"] = lambda: brotli.Compressor(quality=11)
+    return compressors
+
+def precompress_file(path: Path) -> Dict[str, int]:
+    """Write compressed siblings (app.js.gz, app.js.br) next to path.
+
+    Returns the size of each sibling kept, by content coding. Siblings that
+    do not save enough space are removed again.
+    """
+    original_size = path.stat().st_size
+    encodings = {}
+    for encoding, factory in _compressors().items():
+        sibling = path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+        compressor = factory()
+        size = 0
+        with open(path, 'rb') as src, open(sibling, 'wb') as dst:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out = compressor.process(chunk)
+                size += len(out)
+                dst.write(out)
+            out = compressor.finish()
+            size += len(out)
+            dst.write(out)
+        if size > original_size * PRECOMPRESS_MAX_RATIO:
+            sibling.unlink(missing_ok=True)
+            continue
+        encodings[encoding] = size
+    return encodings
+
+def precompress_manifest(report_dir: Path, manifest: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Precompress compressible manifest entries; returns the updated manifest
+    (entries gain an "encodings" map of coding -> size) and the file count"""
+    compressed = 0
+    updated = []
+    for entry in manifest:
+        content_type = entry.get("content_type") or guess_content_type(Path(entry["path"]))
+        entry = {key: value for key, value in entry.items() if key != "encodings"}
+        if content_type in COMPRESSIBLE_TYPES and entry["size"] >= PRECOMPRESS_MIN_SIZE:
+            encodings = precompress_file(report_dir / entry["path"])
+            if encodings:
+                entry["encodings"] = encodings
+                compressed += 1
+        updated.append(entry)
+    return updated, compressed
+
+async def precompress_manifest_async(
+    report_dir: Path,
+    manifest: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Run precompress_manifest on the extraction pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        extraction_executor, precompress_manifest, report_dir, manifest
+    )
@@ -4,6 +4,8 @@ from datetime import datetime
 from typing import Optional, Dict, Any
 import uuid
 
+from activity_sink import activity_sink
+
 async def log_activity(
     db: AsyncIOMotorDatabase,
     user_id: Optional[str],
@@ -12,13 +14,16 @@ async def log_activity(
     description: str,
     ip_address: Optional[str] = None,
     user_agent: Optional[str] = None,
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = None,
+    company_id: Optional[str] = None
 ):
-    """Log user activity to database"""
+    """Log user activity to database (batched by the background log sink).
+    company_id is the company the activity concerns, used by the rollups."""
     activity = {
         "id": str(uuid.uuid4()),
         "user_id": user_id,
         "user_email": user_email,
+        "company_id": company_id,
         "activity_type": activity_type.value,
         "description": description,
         "ip_address": ip_address,
@@ -27,11 +32,42 @@ async def log_activity(
         "timestamp": datetime.utcnow()
     }
     
-    await db.activity_logs.insert_one(activity)
+    await activity_sink.write(db, activity)
+
+def activity_log_filter(
+    user_id: Optional[str] = None,
+    activity_type: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    report_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Mongo filter for an activity log query; every field combination is
+    served by one of the (field, timestamp, id) compound indexes"""
+    filter_query: Dict[str, Any] = {}
+    if user_id:
+        filter_query["user_id"] = user_id
+    if activity_type:
+        filter_query["activity_type"] = activity_type
+    if ip_address:
+        filter_query["ip_address"] = ip_address
+    if report_id:
+        filter_query["metadata.report_id"] = report_id
+    if since or until:
+        window = {}
+        if since:
+            window["$gte"] = since
+        if until:
+            window["$lt"] = until
+        filter_query["timestamp"] = window
+    return filter_query
 
 def sanitize_filename(filename: str) -> str:
     """Sanitize filename for safe storage"""
     import re
+    import unicodedata
+    # Use one Unicode form on disk (macOS clients send NFD)
+    filename = unicodedata.normalize('NFC', filename)
     # Remove or replace dangerous characters
     filename = re.sub(r'[<>:"/\|?*]', '_', filename)
     # Remove leading/trailing dots and spaces
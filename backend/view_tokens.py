@@ -0,0 +1,125 @@
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps tokens in this process; "mongo" shares them between workers
+VIEW_TOKEN_STORE = os.environ.get("VIEW_TOKEN_STORE", "memory").lower()
+VIEW_TOKEN_MAX_ENTRIES = int(os.environ.get("VIEW_TOKEN_MAX_ENTRIES", "100000"))
+VIEW_TOKEN_SWEEP_INTERVAL = float(os.environ.get("VIEW_TOKEN_SWEEP_INTERVAL", "60"))
+
+class MemoryViewTokenStore:
+    """Process-local token store with a heap-ordered expiry sweeper and a size cap"""
+
+    def __init__(self, max_entries: int, sweep_interval: float):
+        self.max_entries = max(1, max_entries)
+        self.sweep_interval = sweep_interval
+        self._tokens: Dict[str, Dict[str, Any]] = {}
+        self._expiry_heap: List[Tuple[datetime, str]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.expired = 0
+        self.evicted = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def put(self, token: str, data: Dict[str, Any]):
+        while len(self._tokens) >= self.max_entries and self._expiry_heap:
+            # Over the cap: drop the tokens closest to expiring first
+            _, victim = heapq.heappop(self._expiry_heap)
+            if self._tokens.pop(victim, None) is not None:
+                self.evicted += 1
+        self._tokens[token] = data
+        heapq.heappush(self._expiry_heap, (data["expiry"], token))
+
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        data = self._tokens.get(token)
+        if data is None:
+            return None
+        if datetime.utcnow() > data["expiry"]:
+            del self._tokens[token]
+            return None
+        return data
+
+    async def delete(self, token: str):
+        self._tokens.pop(token, None)
+
+    def sweep(self) -> int:
+        """Remove every expired token; cost is proportional to what expired"""
+        now = datetime.utcnow()
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, token = heapq.heappop(self._expiry_heap)
+            if self._tokens.pop(token, None) is not None:
+                removed += 1
+        # Heap entries for tokens deleted early are skipped lazily above
+        self.expired += removed
+        return removed
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "size": len(self._tokens),
+            "max_entries": self.max_entries,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+class MongoViewTokenStore:
+    """Token store shared across workers; a TTL index on expiry removes old tokens"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self._db = db
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def put(self, token: str, data: Dict[str, Any]):
+        await self._db.view_tokens.insert_one({"token": token, **data})
+
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        # The TTL monitor only runs periodically, so check expiry here as well
+        return await self._db.view_tokens.find_one(
+            {"token": token, "expiry": {"$gt": datetime.utcnow()}}, {"_id": 0}
+        )
+
+    async def delete(self, token: str):
+        await self._db.view_tokens.delete_one({"token": token})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "mongo"}
+
+view_token_store = MemoryViewTokenStore(VIEW_TOKEN_MAX_ENTRIES, VIEW_TOKEN_SWEEP_INTERVAL)
+
+def configure_view_token_store(db: AsyncIOMotorDatabase):
+    """Select the configured backend and start it"""
+    global view_token_store
+    if VIEW_TOKEN_STORE == "mongo":
+        view_token_store = MongoViewTokenStore(db)
+    view_token_store.start()
+    logger.info(f"View token store: {VIEW_TOKEN_STORE}")
+
+def get_view_token_store():
+    """Get the active view token store"""
+    return view_token_store
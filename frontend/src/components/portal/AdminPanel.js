@@ -84,6 +84,9 @@ const UploadReportSection = ({ companies, token, onUploadSuccess }) => {
 
       const result = await response.json();
       let successMsg = `Reporte "${title}" subido exitosamente. ${result.files_uploaded} archivo(s) subido(s).`;
+      if (result.job_id) {
+        successMsg += ' El reporte se está procesando y aparecerá en la lista en unos momentos.';
+      }
       if (result.notifications_sent > 0) {
         successMsg += ` ${result.notifications_sent} notificación(es) enviada(s).`;
       }